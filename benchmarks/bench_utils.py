@@ -0,0 +1,24 @@
+"""Shared helpers of the benchmarks, import it after `sys.path` points to `opengait/`."""
+import os
+import logging
+import subprocess
+
+import torch
+from utils import get_msg_mgr
+
+
+def init_distributed():
+    """Init a single process group, the samplers and the losses ask for the rank and world size."""
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', '29533')
+    torch.distributed.init_process_group('gloo', rank=0, world_size=1)
+    msg_mgr = get_msg_mgr()
+    msg_mgr.init_logger('output/benchmark', False)
+    msg_mgr.logger.setLevel(logging.WARNING)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
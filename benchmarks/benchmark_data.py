@@ -0,0 +1,205 @@
+"""Benchmark the data pipeline of a config, without any model.
+
+The `DataSet`, the sampler, the `CollateFn` and the transforms are built from the config as in training.
+ Two things are measured:
+ - the stage time per batch in the main process: disk read, unpickle, sampling (the `CollateFn`) and the
+   transforms, and the histogram of the sequence lengths;
+ - the batches/s and frames/s of the `DataLoader` for each `num_workers`, `cache` and `sample_type`,
+   with a recommended `num_workers`.
+
+Run it from the root of the repository:
+
+python benchmarks/benchmark_data.py --cfgs ./configs/deepgaitv2/DeepGaitV2_gait3d.yaml --num_workers 0 1 2 4 8 --batches 50
+python benchmarks/benchmark_data.py --cfgs ./configs/gaitbase/gaitbase_da_gait3d.yaml --cache false true --step_ms 250
+
+Note the disk read is much faster once the files are in the page cache of the OS, e.g. in the second run.
+"""
+import sys
+import json
+import time
+import pickle
+import argparse
+import os.path as osp
+
+import numpy as np
+
+parser = argparse.ArgumentParser(description='Throughput benchmark of the data pipeline.')
+parser.add_argument('--cfgs', type=str, required=True, help="path of config file")
+parser.add_argument('--phase', default='train', choices=['train', 'test'],
+                    help="benchmark the train or the test pipeline")
+parser.add_argument('--batches', type=int, default=50, help="timed batches per setting")
+parser.add_argument('--warmup', type=int, default=2,
+                    help="untimed batches per setting, covering the start of the workers")
+parser.add_argument('--num_workers', type=int, nargs='+', default=[0, 1, 2, 4, 8],
+                    help="numbers of workers to sweep")
+parser.add_argument('--cache', type=str, nargs='+', default=['false'], choices=['false', 'true'],
+                    help="data_cfg.cache settings to sweep")
+parser.add_argument('--sample_types', type=str, nargs='+', default=None,
+                    help="sample types to sweep, e.g. fixed_unordered unfixed_unordered, the one of the config by default")
+parser.add_argument('--step_ms', type=float, default=None,
+                    help="time of one training step, e.g. from benchmark_models.py, to tell whether the loader keeps up")
+parser.add_argument('--output', type=str, default='benchmark_data.json', help="path of the result json")
+opt = parser.parse_args()
+
+sys.path.insert(1, osp.join(osp.dirname(osp.abspath(__file__)), '..', 'opengait'))
+
+import torch.utils.data as tordata  # noqa: E402
+import data.sampler as Samplers  # noqa: E402
+from data.dataset import DataSet  # noqa: E402
+from data.collate_fn import CollateFn  # noqa: E402
+from data.transform import get_transform  # noqa: E402
+from utils import config_loader, get_attr_from, get_valid_args  # noqa: E402
+from bench_utils import init_distributed, git_commit  # noqa: E402
+
+
+def build_loader(data_cfg, sampler_cfg, training, num_workers):
+    """The same as `BaseModel.get_loader`."""
+    dataset = DataSet(data_cfg, training)
+    Sampler = get_attr_from([Samplers], sampler_cfg['type'])
+    vaild_args = get_valid_args(Sampler, sampler_cfg, free_keys=[
+        'sample_type', 'type'])
+    sampler = Sampler(dataset, **vaild_args)
+    loader = tordata.DataLoader(
+        dataset=dataset,
+        batch_sampler=sampler,
+        collate_fn=CollateFn(dataset.label_set, sampler_cfg),
+        num_workers=num_workers)
+    return loader
+
+
+def frames_of(batch):
+    seqL_batch = batch[4]
+    if seqL_batch is not None:
+        return int(np.sum(seqL_batch))
+    return sum(len(seq) for seq in batch[0][0])
+
+
+def transform(trfs, batch):
+    """The transforms of `BaseModel.inputs_pretreament`, without the copy to the device."""
+    return [np.asarray([trf(fra) for fra in seq]) for trf, seq in zip(trfs, batch[0])]
+
+
+def profile_stages(loader, trfs, batches):
+    """Run the pipeline stage by stage in the main process, and time each stage."""
+    dataset, collate_fn = loader.dataset, loader.collate_fn
+    times = {'read': 0., 'unpickle': 0., 'sampling': 0., 'transform': 0.}
+    seq_lens, frames, count = [], 0, 0
+    for indices in loader.batch_sampler:
+        if count >= batches:
+            break
+        items = []
+        for idx in indices:
+            data_list = []
+            for pth in sorted(dataset.seqs_info[idx][-1]):
+                start = time.perf_counter()
+                with open(pth, 'rb') as f:
+                    raw = f.read()
+                times['read'] += time.perf_counter() - start
+                start = time.perf_counter()
+                data_list.append(pickle.loads(raw))
+                times['unpickle'] += time.perf_counter() - start
+            seq_lens.append(len(data_list[0]))
+            items.append((data_list, dataset.seqs_info[idx]))
+
+        start = time.perf_counter()
+        batch = collate_fn(items)
+        times['sampling'] += time.perf_counter() - start
+        start = time.perf_counter()
+        transform(trfs, batch)
+        times['transform'] += time.perf_counter() - start
+        frames += frames_of(batch)
+        count += 1
+
+    stages = {'%s_ms' % k: v / count * 1000 for k, v in times.items()}
+    hist, edges = np.histogram(seq_lens, bins=10)
+    return {
+        'batches': count,
+        'stage_ms_per_batch': stages,
+        'frames_per_batch': frames / count,
+        'seq_len': {
+            'min': int(np.min(seq_lens)), 'mean': float(np.mean(seq_lens)), 'max': int(np.max(seq_lens)),
+            'histogram': {'%d-%d' % (edges[i], edges[i + 1]): int(hist[i]) for i in range(len(hist))}}}
+
+
+def measure_loader(loader, batches, warmup):
+    """Iterate the loader and get its batches/s and frames/s."""
+    iterator = iter(loader)
+    for _ in range(warmup):
+        next(iterator)
+    frames = 0
+    start = time.perf_counter()
+    for _ in range(batches):
+        frames += frames_of(next(iterator))
+    cost = time.perf_counter() - start
+    return {'batches_per_second': batches / cost, 'frames_per_second': frames / cost}
+
+
+def recommend(sweep, step_ms):
+    """Pick the fewest workers reaching 95% of the best throughput for each cache and sample type."""
+    recommendations = []
+    for key in sorted(set((r['cache'], r['sample_type']) for r in sweep)):
+        runs = [r for r in sweep if (r['cache'], r['sample_type']) == key and 'error' not in r]
+        if len(runs) == 0:
+            continue
+        best = max(r['batches_per_second'] for r in runs)
+        pick = min((r for r in runs if r['batches_per_second'] >= 0.95 * best),
+                   key=lambda r: r['num_workers'])
+        recommendation = {'cache': key[0], 'sample_type': key[1], 'num_workers': pick['num_workers'],
+                          'batches_per_second': pick['batches_per_second']}
+        string = "cache={}, sample_type={}: num_workers={} ({:.2f} batches/s)".format(
+            key[0], key[1], pick['num_workers'], pick['batches_per_second'])
+        if step_ms is not None:
+            required = 1000. / step_ms
+            recommendation['keeps_up'] = bool(best >= required)
+            string += ", the loader {} the {:.2f} steps/s of the model".format(
+                'keeps up with' if best >= required else 'can NOT keep up with, input-bound at', required)
+        print(string)
+        recommendations.append(recommendation)
+    return recommendations
+
+
+if __name__ == '__main__':
+    init_distributed()
+    cfgs = config_loader(opt.cfgs)
+    training = opt.phase == 'train'
+    data_cfg = cfgs['data_cfg']
+    sampler_cfg = cfgs['trainer_cfg' if training else 'evaluator_cfg']['sampler']
+    trfs = get_transform(cfgs['trainer_cfg' if training else 'evaluator_cfg']['transform'])
+    sample_types = opt.sample_types or [sampler_cfg['sample_type']]
+
+    data_cfg['cache'] = False
+    loader = build_loader(data_cfg, sampler_cfg, training, 0)
+    profile = profile_stages(loader, trfs, opt.batches)
+    print("Stage time per batch: " + ", ".join(
+        "{}={:.2f}".format(k, v) for k, v in profile['stage_ms_per_batch'].items()))
+    print("Sequence length: " + json.dumps(profile['seq_len']))
+
+    sweep = []
+    for cache in opt.cache:
+        for sample_type in sample_types:
+            for num_workers in opt.num_workers:
+                data_cfg['cache'] = cache == 'true'
+                sampler_cfg['sample_type'] = sample_type
+                result = {'cache': data_cfg['cache'], 'sample_type': sample_type, 'num_workers': num_workers}
+                # release the loader and the workers of the former setting, even if this one fails to build
+                loader = None
+                try:
+                    start = time.perf_counter()
+                    loader = build_loader(data_cfg, sampler_cfg, training, num_workers)
+                    result['build_seconds'] = time.perf_counter() - start
+                    result.update(measure_loader(loader, opt.batches, opt.warmup))
+                except Exception as e:
+                    result['error'] = repr(e)
+                print(json.dumps(result))
+                sweep.append(result)
+
+    report = {
+        'commit': git_commit(),
+        'cfgs': opt.cfgs,
+        'phase': opt.phase,
+        'profile': profile,
+        'sweep': sweep,
+        'recommendations': recommend(sweep, opt.step_ms)}
+    with open(opt.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results saved in %s" % opt.output)
@@ -0,0 +1,105 @@
+"""Benchmark the startup: the time to import the packages of OpenGait and get the model class of a config.
+
+Each measure runs in a fresh python process, so nothing is cached in `sys.modules`, though the files may be in
+ the page cache of the OS after the first run. For each model it reports the median wall time of the imports,
+ the heavy third-party packages loaded (e.g. sklearn, kornia, cv2), and the slowest imports by `-X importtime`.
+
+Run it from the root of the repository:
+
+python benchmarks/benchmark_import.py --models GaitSet DeepGaitV2 BigGait__Dinov2_Gaitbase --runs 5
+python benchmarks/benchmark_import.py --cfgs ./configs/gaitset/gaitset.yaml --output import.json
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import os.path as osp
+
+parser = argparse.ArgumentParser(description='Import-time benchmark of the startup.')
+parser.add_argument('--models', type=str, nargs='+', default=[], help="model names to get, e.g. GaitSet")
+parser.add_argument('--cfgs', type=str, nargs='+', default=[],
+                    help="config files, the model, the backbone, the losses and the transforms of which are loaded")
+parser.add_argument('--runs', type=int, default=5, help="fresh processes per model")
+parser.add_argument('--top', type=int, default=10, help="number of the slowest imports to print")
+parser.add_argument('--output', type=str, default=None, help="path of the result json")
+opt = parser.parse_args()
+
+OPENGAIT_DIR = osp.join(osp.dirname(osp.abspath(__file__)), '..', 'opengait')
+HEAVY_PACKAGES = ['sklearn', 'kornia', 'cv2', 'matplotlib', 'einops', 'scipy', 'timm']
+
+# the imports of main.py, then the classes of the config, as `BaseModel` and `LossAggregator` get them
+SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {opengait_dir!r})
+from modeling import models, backbones, losses
+from modeling.ensemble import run_ensemble_test
+from utils import config_loader, get_attr_from
+from data.transform import get_transform
+model, cfgs_path = {model!r}, {cfgs!r}
+if cfgs_path:
+    cfgs = config_loader(cfgs_path)
+    model = cfgs['model_cfg']['model']
+    backbone_cfg = cfgs['model_cfg'].get('backbone_cfg')
+    if isinstance(backbone_cfg, dict):
+        get_attr_from([backbones], backbone_cfg['type'])
+    loss_cfgs = cfgs['loss_cfg'] if isinstance(cfgs['loss_cfg'], list) else [cfgs['loss_cfg']]
+    for loss_cfg in loss_cfgs:
+        get_attr_from([losses], loss_cfg['type'])
+    get_transform(cfgs['trainer_cfg']['transform'])
+getattr(models, model)
+cost = time.perf_counter() - start
+print(json.dumps({{'seconds': cost, 'heavy': [p for p in {heavy!r} if p in sys.modules]}}))
+"""
+
+
+def run_once(model, cfgs):
+    """Import in a fresh process, and get the time, the heavy packages loaded and the `-X importtime` log."""
+    script = SCRIPT.format(opengait_dir=OPENGAIT_DIR, model=model, cfgs=cfgs, heavy=HEAVY_PACKAGES)
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def slowest_imports(log, top):
+    """Parse the `-X importtime` log: `import time: self [us] | cumulative | imported package`."""
+    imports = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.rstrip()))
+    # the top-level ones, not indented, not to count a package and its submodules twice
+    imports = [(c, n.strip()) for c, n in imports if not n.startswith('  ')]
+    return sorted(imports, reverse=True)[:top]
+
+
+def benchmark(model, cfgs):
+    name = cfgs or model
+    result = {'model': model, 'cfgs': cfgs}
+    try:
+        records = [run_once(model, cfgs) for _ in range(opt.runs)]
+    except RuntimeError as e:
+        result['error'] = str(e)
+        print("{}: {}".format(name, result['error']))
+        return result
+    result['seconds'] = statistics.median([r[0]['seconds'] for r in records])
+    result['heavy_packages'] = records[-1][0]['heavy']
+    result['slowest_imports'] = [{'name': n, 'ms': c / 1000} for c, n in slowest_imports(records[-1][1], opt.top)]
+    print("{}: {:.3f}s, heavy packages loaded: {}".format(name, result['seconds'], result['heavy_packages'] or 'none'))
+    for item in result['slowest_imports']:
+        print("    {:>10.1f} ms  {}".format(item['ms'], item['name']))
+    return result
+
+
+if __name__ == '__main__':
+    if not opt.models and not opt.cfgs:
+        parser.error("give --models or --cfgs")
+    results = [benchmark(model, None) for model in opt.models] + [benchmark(None, cfgs) for cfgs in opt.cfgs]
+    if opt.output is not None:
+        with open(opt.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+        print("Results saved in %s" % opt.output)
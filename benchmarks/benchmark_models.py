@@ -0,0 +1,210 @@
+"""Benchmark the models built from the configs with synthetic data.
+
+No dataset is touched: the raw batches are generated with the shapes of the modalities the config
+ expects (silhouettes, heatmaps, poses, point clouds, RGB images + ratios, SMPL parameters), then go
+ through the model's own `inputs_pretreament` and transforms, the forward, the losses and the backward.
+
+Run it from the root of the repository, on cpu by default:
+
+python benchmarks/benchmark_models.py --cfgs ./configs/deepgaitv2 ./configs/gaitbase/gaitbase_da_gait3d.yaml --batch_sizes 1 4 --frames 30 --output bench.json
+python benchmarks/benchmark_models.py --cfgs ./configs --output new.json --baseline old.json --tolerance 0.1
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import resource
+import os.path as osp
+
+import numpy as np
+
+parser = argparse.ArgumentParser(description='Synthetic-data benchmark of the models.')
+parser.add_argument('--cfgs', type=str, nargs='+', default=['./configs'],
+                    help="config files or directories of config files to benchmark")
+parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 4],
+                    help="numbers of sequences per batch")
+parser.add_argument('--frames', type=int, nargs='+', default=[30],
+                    help="numbers of frames per sequence")
+parser.add_argument('--warmup', type=int, default=2, help="untimed iterations before timing")
+parser.add_argument('--iters', type=int, default=5, help="timed iterations")
+parser.add_argument('--device', default='cpu', choices=['cpu', 'cuda'], help="device to run on")
+parser.add_argument('--no_train', action='store_true', help="benchmark the inference only")
+parser.add_argument('--output', type=str, default='benchmark.json', help="path of the result json")
+parser.add_argument('--baseline', type=str, default=None,
+                    help="result json of a former run to compare with")
+parser.add_argument('--tolerance', type=float, default=0.1,
+                    help="relative slow down over the baseline to report as regression")
+opt = parser.parse_args()
+
+if opt.device == 'cpu':
+    # before importing torch, so the models are built on cpu
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+sys.path.insert(1, osp.join(osp.dirname(osp.abspath(__file__)), '..', 'opengait'))
+
+import torch  # noqa: E402
+from modeling import models  # noqa: E402
+from utils import config_loader  # noqa: E402
+from bench_utils import init_distributed, git_commit  # noqa: E402
+from synthetic import get_modalities, synthetic_batch, build_model  # noqa: E402
+
+
+def list_cfgs(paths):
+    cfgs = []
+    for path in paths:
+        if osp.isdir(path):
+            cfgs += sorted(glob.glob(osp.join(path, '**', '*.yaml'), recursive=True))
+        else:
+            cfgs.append(path)
+    return [cfg for cfg in cfgs if osp.basename(cfg) != 'default.yaml']
+
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def peak_memory_mb():
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 2 ** 20
+    # in KB on Linux, the peak of the whole process
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def run_train_iter(model, batch):
+    times = {}
+    synchronize()
+    start = time.perf_counter()
+    ipts = model.inputs_pretreament(batch)
+    synchronize()
+    times['pretreatment'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with model.autocast():
+        retval = model(ipts)
+        loss_sum, _ = model.loss_aggregator(retval['training_feat'])
+    synchronize()
+    times['forward'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.optimizer.zero_grad()
+    loss_sum.backward()
+    synchronize()
+    times['backward'] = time.perf_counter() - start
+    return times
+
+
+def run_inference_iter(model, batch):
+    times = {}
+    synchronize()
+    start = time.perf_counter()
+    ipts = model.inputs_pretreament(batch)
+    synchronize()
+    times['pretreatment'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with torch.no_grad(), model.autocast():
+        model(ipts)
+    synchronize()
+    times['forward'] = time.perf_counter() - start
+    return times
+
+
+def measure(run_iter, model, batch, batch_size):
+    for _ in range(opt.warmup):
+        run_iter(model, batch)
+    records = [run_iter(model, batch) for _ in range(opt.iters)]
+    result = {'%s_ms' % k: float(np.median([r[k] for r in records])) * 1000
+              for k in records[0].keys()}
+    step_ms = sum(v for k, v in result.items() if k != 'pretreatment_ms')
+    result['seqs_per_second'] = batch_size / step_ms * 1000
+    return result
+
+
+def benchmark_cfg(path):
+    cfgs = config_loader(path)
+    if 'model_cfg' not in cfgs or not hasattr(models, cfgs['model_cfg'].get('model', '')):
+        return [{'cfgs': path, 'skipped': "no registered model in the config"}]
+    modalities = get_modalities(cfgs)
+    try:
+        model = build_model(cfgs)
+    except Exception as e:
+        return [{'cfgs': path, 'model': cfgs['model_cfg']['model'], 'error': 'build: %r' % e}]
+
+    results = []
+    for batch_size in opt.batch_sizes:
+        for frames in opt.frames:
+            result = {'cfgs': path, 'model': cfgs['model_cfg']['model'], 'modalities': modalities,
+                      'batch_size': batch_size, 'frames': frames}
+            if torch.cuda.is_available():
+                torch.cuda.reset_peak_memory_stats()
+            batch = synthetic_batch(modalities, batch_size, frames, cfgs)
+            try:
+                if not opt.no_train:
+                    model.train()
+                    result['train'] = measure(run_train_iter, model, batch, batch_size)
+                model.eval()
+                result['inference'] = measure(run_inference_iter, model, batch, batch_size)
+            except Exception as e:
+                result['error'] = repr(e)
+            result['peak_memory_mb'] = peak_memory_mb()
+            results.append(result)
+            print("{cfgs} bs={batch_size} s={frames}: {summary}".format(
+                summary=result.get('error', {k: round(v['seqs_per_second'], 2) for k, v in result.items()
+                                             if k in ['train', 'inference']}), **result))
+    del model
+    return results
+
+
+def result_key(result):
+    return '%s|%s|%s' % (result['cfgs'], result.get('batch_size'), result.get('frames'))
+
+
+def compare(results, baseline_path, tolerance):
+    """Print the change of seqs/s against the baseline, and return the number of regressions."""
+    with open(baseline_path, 'r') as f:
+        baseline = {result_key(r): r for r in json.load(f)['results']}
+    regressions = 0
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old is None:
+            continue
+        for mode in ['train', 'inference']:
+            if mode not in result or mode not in old:
+                continue
+            new_speed, old_speed = result[mode]['seqs_per_second'], old[mode]['seqs_per_second']
+            change = new_speed / old_speed - 1
+            flag = ''
+            if change < -tolerance:
+                flag = '  <-- REGRESSION'
+                regressions += 1
+            print("{} {}: {:.2f} -> {:.2f} seqs/s ({:+.1%}){}".format(
+                result_key(result), mode, old_speed, new_speed, change, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    init_distributed()
+    torch.manual_seed(0)
+    np.random.seed(0)
+    results = []
+    for path in list_cfgs(opt.cfgs):
+        results += benchmark_cfg(path)
+
+    report = {
+        'commit': git_commit(),
+        'torch': torch.__version__,
+        'device': torch.cuda.get_device_name() if torch.cuda.is_available() else platform.processor() or 'cpu',
+        'threads': torch.get_num_threads(),
+        'results': results}
+    with open(opt.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results saved in %s" % opt.output)
+
+    if opt.baseline is not None:
+        regressions = compare(results, opt.baseline, opt.tolerance)
+        if regressions > 0:
+            print("%d regressions over %.0f%%." % (regressions, opt.tolerance * 100))
+            sys.exit(1)
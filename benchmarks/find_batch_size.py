@@ -0,0 +1,204 @@
+"""Find the largest batch and frame numbers of a config that fit in the device memory, before the real run.
+
+The model is built from the config and probed with synthetic batches, see `synthetic.py`:
+ - train: the forward, the losses, the backward and the optimizer step, for the largest `P` of
+   `trainer_cfg.sampler.batch_size` at the frames of the config, and the largest frames (`frames_num_fixed`,
+   or `frames_num_max` of the unfixed sampling) at the `P` of the config;
+ - test: the forward without gradients, for the largest `frames_all_limit` of `evaluator_cfg.sampler` at the
+   batch size of the config, and the largest batch size at the frames for the models of `batched_inference`.
+Each size is doubled until the peak memory reserved goes over the budget, the total memory less `--headroom`,
+ or runs out of memory, and then bisected. Keep some headroom, the synthetic frames may be smaller than the
+ real ones, and the lengths of the real sequences vary.
+
+Run it from the root of the repository, on one GPU of the kind used by the training:
+
+python benchmarks/find_batch_size.py --cfgs ./configs/deepgaitv2/DeepGaitV2_gait3d.yaml --world_size 4
+python benchmarks/find_batch_size.py --cfgs ./configs/gaitbase/gaitbase_da_gait3d.yaml --apply batch --save ./configs/gaitbase/gaitbase_da_gait3d_auto.yaml
+"""
+import gc
+import sys
+import math
+import argparse
+import os.path as osp
+
+import yaml
+
+parser = argparse.ArgumentParser(description='Find the largest batch and frame numbers fitting in the device memory.')
+parser.add_argument('--cfgs', type=str, required=True, help="path of config file")
+parser.add_argument('--phase', type=str, nargs='+', default=['train', 'test'], choices=['train', 'test'],
+                    help="probe the training, the test or both")
+parser.add_argument('--world_size', type=int, default=1,
+                    help="number of GPUs of the real run, the batch sizes of the config are split among them")
+parser.add_argument('--headroom', type=float, default=0.1,
+                    help="fraction of the device memory kept free, for the fragmentation and the longer real sequences")
+parser.add_argument('--max_p', type=int, default=256, help="largest P of the training batch size to probe")
+parser.add_argument('--max_frames', type=int, default=1024, help="largest number of frames per sequence to probe")
+parser.add_argument('--max_batch_size', type=int, default=256, help="largest test batch size per GPU to probe")
+parser.add_argument('--apply', default='batch', choices=['batch', 'frames'],
+                    help="which recommendation to save, the largest batch size or the largest frames")
+parser.add_argument('--save', type=str, default=None,
+                    help="save a copy of the config file with the recommendations to this path")
+opt = parser.parse_args()
+
+sys.path.insert(1, osp.join(osp.dirname(osp.abspath(__file__)), '..', 'opengait'))
+
+import torch  # noqa: E402
+from utils import config_loader  # noqa: E402
+from bench_utils import init_distributed  # noqa: E402
+from synthetic import get_modalities, synthetic_batch, build_model  # noqa: E402
+
+
+def fits(run, budget):
+    """Run once and tell whether the peak memory stays within the budget."""
+    gc.collect()
+    torch.cuda.empty_cache()
+    torch.cuda.reset_peak_memory_stats()
+    try:
+        run()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_reserved() <= budget
+    except torch.cuda.OutOfMemoryError:
+        return False
+
+
+def largest(fit, start, limit, step=1):
+    """The largest multiple of `step` in [start, limit] that fits, by doubling from `start` and bisecting.
+
+    Returns:
+        int: the size, or None if even `start` does not fit.
+    """
+    limit = limit // step * step
+    if start > limit or not fit(start):
+        return None
+    good, bad = start, None
+    while bad is None:
+        size = min(good * 2, limit)
+        if size == good:
+            return good
+        if fit(size):
+            good = size
+        else:
+            bad = size
+    while bad - good > step:
+        middle = (good + bad) // 2 // step * step
+        if middle <= good:
+            break
+        if fit(middle):
+            good = middle
+        else:
+            bad = middle
+    return good
+
+
+def train_step(model, batch):
+    try:
+        ipts = model.inputs_pretreament(batch)
+        with model.autocast():
+            retval = model(ipts)
+            loss_sum, _ = model.loss_aggregator(retval['training_feat'])
+        del retval, ipts
+        loss_sum.backward()
+        # the states of the optimizer are allocated by the first step
+        model.optimizer.step()
+    finally:
+        # not to carry the gradients of an out of memory step to the next probe
+        model.optimizer.zero_grad(set_to_none=True)
+
+
+def test_step(model, batch):
+    with torch.no_grad(), model.autocast():
+        model(model.inputs_pretreament(batch))
+
+
+def probe_train(model, cfgs, modalities, budget):
+    sampler_cfg = cfgs['trainer_cfg']['sampler']
+    P, K = sampler_cfg['batch_size']
+    unfixed = not sampler_cfg['sample_type'].startswith('fixed')
+    frames_key = 'frames_num_max' if unfixed else 'frames_num_fixed'
+    frames = sampler_cfg[frames_key]
+    # P x K is split among the GPUs
+    step = opt.world_size // math.gcd(K, opt.world_size)
+
+    def fit(p, f):
+        model.train()
+        batch = synthetic_batch(modalities, p * K // opt.world_size, f, cfgs, seqs_per_label=K, packed=unfixed)
+        return fits(lambda: train_step(model, batch), budget)
+
+    best_p = largest(lambda p: fit(p, frames), step, opt.max_p, step)
+    best_frames = largest(lambda f: fit(P, f), 1, opt.max_frames)
+    print("train: batch_size {} x {} with {} {} per sequence on each of {} GPUs".format(P, K, frames, frames_key, opt.world_size))
+    print("  largest P at {} frames: {}".format(frames, best_p))
+    print("  largest {} at P = {}: {}".format(frames_key, P, best_frames))
+
+    recommendation = {}
+    if opt.apply == 'batch' and best_p is not None:
+        recommendation['batch_size'] = [best_p, K]
+    elif opt.apply == 'frames' and best_frames is not None:
+        recommendation[frames_key] = best_frames
+        if unfixed and sampler_cfg['frames_num_min'] > best_frames:
+            recommendation['frames_num_min'] = best_frames
+    return recommendation
+
+
+def probe_test(model, cfgs, modalities, budget):
+    sampler_cfg = cfgs['evaluator_cfg']['sampler']
+    batch_size = max(1, sampler_cfg['batch_size'] // opt.world_size)
+    packed = not sampler_cfg['sample_type'].startswith('fixed')
+    if sampler_cfg['sample_type'].startswith('all'):
+        frames_key = 'frames_all_limit'
+    else:
+        frames_key = 'frames_num_max' if packed else 'frames_num_fixed'
+    frames = sampler_cfg.get(frames_key, opt.max_frames)
+
+    def fit(b, f):
+        model.eval()
+        batch = synthetic_batch(modalities, b, f, cfgs, packed=packed)
+        return fits(lambda: test_step(model, batch), budget)
+
+    print("test: batch_size {} with {} {} per sequence on each of {} GPUs".format(
+        batch_size, frames, frames_key, opt.world_size))
+    best_frames = largest(lambda f: fit(batch_size, f), 1, opt.max_frames)
+    print("  largest {} at batch_size {} per GPU: {}".format(frames_key, batch_size, best_frames))
+    best_batch = None
+    if model.batched_inference:
+        best_batch = largest(lambda b: fit(b, frames), 1, opt.max_batch_size)
+        print("  largest batch_size per GPU at {} frames: {}".format(frames, best_batch))
+
+    # one batch of the models without `batched_inference` per GPU
+    if opt.apply == 'batch' and best_batch is not None:
+        return {'batch_size': best_batch * opt.world_size}
+    if best_frames is not None:
+        return {frames_key: best_frames}
+    return {}
+
+
+def save_cfgs(recommendations):
+    """Save the recommendations into a copy of the config file, the defaults still merged when loaded."""
+    with open(opt.cfgs, 'r') as f:
+        cfgs = yaml.safe_load(f)
+    for engine, recommendation in recommendations.items():
+        sampler_cfg = cfgs.setdefault(engine, {}).setdefault('sampler', {})
+        sampler_cfg.update(recommendation)
+    with open(opt.save, 'w') as f:
+        yaml.safe_dump(cfgs, f, default_flow_style=False, sort_keys=False)
+    print("Config with the recommendations saved in %s" % opt.save)
+
+
+if __name__ == '__main__':
+    if not torch.cuda.is_available():
+        sys.exit("A CUDA device is needed to probe the memory.")
+    init_distributed()
+    cfgs = config_loader(opt.cfgs)
+    modalities = get_modalities(cfgs)
+    model = build_model(cfgs)
+    budget = torch.cuda.get_device_properties(torch.cuda.current_device()).total_memory * (1 - opt.headroom)
+    print("Memory budget: {:.0f} MB".format(budget / 2 ** 20))
+
+    recommendations = {}
+    if 'train' in opt.phase:
+        recommendations['trainer_cfg'] = probe_train(model, cfgs, modalities, budget)
+    if 'test' in opt.phase:
+        recommendations['evaluator_cfg'] = probe_test(model, cfgs, modalities, budget)
+    print("Recommended: {}".format(recommendations))
+    if opt.save is not None:
+        save_cfgs(recommendations)
@@ -0,0 +1,116 @@
+"""Synthetic inputs and models of the configs for the benchmarks, without any dataset.
+
+The raw batches are generated with the shapes of the modalities the config expects (silhouettes, heatmaps,
+ poses, point clouds, RGB images + ratios, SMPL parameters), in the format of `CollateFn`, to go through the
+ model's own `inputs_pretreament` and transforms.
+"""
+import numpy as np
+
+from modeling import models
+from data.transform import get_transform
+from utils import is_dict, is_list
+
+POSE_TRANSFORMS = ['GaitGraph1Input', 'GaitGraphMultiInput', 'GaitTRMultiInput', 'MSGGTransform',
+                   'SkeletonInput', 'SelectSequenceCenter', 'NormalizeEmpty', 'TwoView']
+SIL_SIZE = 64
+RGB_SIZE = 64
+POINTS_NUM = 256
+JOINTS_NUM = 17
+SMPL_DIM = 85
+
+
+def transform_types(trf_cfg):
+    """Get all the transform types in the transform config, including the ones in `Compose`."""
+    if is_dict(trf_cfg):
+        types = [trf_cfg['type']]
+        for v in trf_cfg.values():
+            if is_list(v) or is_dict(v):
+                types += transform_types(v)
+        return types
+    if is_list(trf_cfg):
+        return sum([transform_types(cfg) for cfg in trf_cfg], [])
+    return []
+
+
+def input_channels(model_cfg):
+    backbone_cfg = model_cfg.get('Backbone', model_cfg.get('backbone_cfg', {}))
+    if not is_dict(backbone_cfg):
+        return 1
+    if 'part1_channel' in backbone_cfg:
+        return backbone_cfg['part1_channel'] + backbone_cfg['part2_channel']
+    return backbone_cfg.get('in_channels', 1)
+
+
+def get_modalities(cfgs):
+    """Guess the modality of each input from the transforms of the config."""
+    model_cfg = cfgs['model_cfg']
+    if model_cfg['model'] == 'SkeletonGaitPP':
+        # heatmaps and silhouettes go through one transform after being concatenated
+        return ['heatmap', 'sil']
+    modalities = []
+    for trf_cfg in cfgs['trainer_cfg']['transform']:
+        types = transform_types(trf_cfg)
+        if 'BaseRgbTransform' in types:
+            modalities.append('rgb')
+        elif 'PointCloudsTransform' in types:
+            modalities.append('points')
+        elif any(t in POSE_TRANSFORMS for t in types):
+            modalities.append('pose')
+        elif types == ['NoOperation']:
+            modalities.append('smpl' if model_cfg['model'] == 'SMPLGait' else 'ratio')
+        elif input_channels(model_cfg) > 1:
+            modalities.append('heatmap')
+        else:
+            modalities.append('sil')
+    return modalities
+
+
+def synthetic_sequence(modality, frames, cfgs):
+    if modality == 'sil':
+        return (np.random.rand(frames, SIL_SIZE, SIL_SIZE) > 0.5).astype(np.uint8) * 255
+    if modality == 'heatmap':
+        channels = 2 if cfgs['model_cfg']['model'] == 'SkeletonGaitPP' else input_channels(cfgs['model_cfg'])
+        return np.random.randint(0, 256, (frames, channels, SIL_SIZE, SIL_SIZE)).astype(np.uint8)
+    if modality == 'rgb':
+        return np.random.randint(0, 256, (frames, 3, RGB_SIZE * 2, RGB_SIZE)).astype(np.float32)
+    if modality == 'ratio':
+        return np.full((frames, 1), 0.5, dtype=np.float32)
+    if modality == 'pose':
+        return np.random.rand(frames, JOINTS_NUM, 3).astype(np.float32)
+    if modality == 'points':
+        return np.random.randn(frames, POINTS_NUM, 3).astype(np.float32)
+    if modality == 'smpl':
+        return np.random.randn(frames, SMPL_DIM).astype(np.float32)
+    raise ValueError("Unknown modality %s." % modality)
+
+
+def synthetic_batch(modalities, batch_size, frames, cfgs, seqs_per_label=2, packed=False):
+    """Get a collated batch of fixed-length sequences, in the format of `CollateFn`.
+
+    Args:
+        seqs_per_label: the `K` of the `TripletSampler`, two at least for the triplets.
+        packed: concatenate the sequences along the frames with `seqL`, as the `unfixed` and `all` sampling do.
+    """
+    seqs_batch = [[synthetic_sequence(m, frames, cfgs) for _ in range(batch_size)]
+                  for m in modalities]
+    labs_batch = [i // seqs_per_label for i in range(batch_size)]
+    typs_batch = ['nm-01'] * batch_size
+    vies_batch = ['000'] * batch_size
+    if not packed:
+        return [seqs_batch, labs_batch, typs_batch, vies_batch, None]
+    seqs_batch = [[np.concatenate(seqs, 0)] for seqs in seqs_batch]
+    return [seqs_batch, labs_batch, typs_batch, vies_batch, np.asarray([[frames] * batch_size])]
+
+
+def build_model(cfgs):
+    """Build the model without the data loaders, for training."""
+    Model = getattr(models, cfgs['model_cfg']['model'])
+    # no dataset needed
+    SyntheticModel = type(Model.__name__, (Model,), {
+        'get_loader': lambda self, data_cfg, train=True: None})
+    cfgs['trainer_cfg']['restore_hint'] = 0
+    cfgs['trainer_cfg']['with_test'] = False
+    cfgs['trainer_cfg']['stage_timing'] = False
+    model = SyntheticModel(cfgs, True)
+    model.evaluator_trfs = get_transform(cfgs['evaluator_cfg']['transform'])
+    return model
@@ -0,0 +1,28 @@
+class CachedLoader(object):
+    """Replay the batches of a deterministic loader, e.g. the test loader.
+
+    The first pass iterates the wrapped loader and keeps the collated batches in memory,
+     the following passes skip the loading, decoding and collating. Make sure the memory is
+     large enough to hold the whole test set.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.dataset = loader.dataset
+        self.batch_sampler = loader.batch_sampler
+        self.batches = None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.batches is not None:
+            return iter(self.batches)
+        return self.__fill()
+
+    def __fill(self):
+        batches = []
+        for batch in self.loader:
+            batches.append(batch)
+            yield batch
+        self.batches = batches
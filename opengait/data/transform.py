@@ -1,7 +1,6 @@
 import numpy as np
 import random
 import torchvision.transforms as T
-import cv2
 import math
 from data import transform as base_transform
 from utils import is_list, is_dict, get_valid_args
@@ -129,6 +128,8 @@ class RandomRotate(object):
         self.degree = degree
 
     def __call__(self, seq):
+        # imported on use, not to load cv2 for the configs without these augmentations
+        import cv2
         if random.uniform(0, 1) >= self.prob:
             return seq
         else:
@@ -153,6 +154,7 @@ class RandomPerspective(object):
         self.prob = prob
 
     def __call__(self, seq):
+        import cv2
         if random.uniform(0, 1) >= self.prob:
             return seq
         else:
@@ -185,6 +187,7 @@ class RandomAffine(object):
         self.degree = degree
 
     def __call__(self, seq):
+        import cv2
         if random.uniform(0, 1) >= self.prob:
             return seq
         else:
@@ -389,6 +392,7 @@ class RandomPartDilate():
         Output:
             img: [h, w]
         '''
+        import cv2
         assert mode in ['RECT', 'CROSS', 'ELLIPSE']
         kernel = cv2.getStructuringElement(getattr(cv2, 'MORPH_'+mode), kernel_size)
         dst = cv2.dilate(img, kernel)
@@ -408,6 +412,7 @@ class RandomPartBlur():
         Output:
             seq: a sequence of agumented frames, [s, h, w]
         '''
+        import cv2
         if not self.per_frame:
             if random.uniform(0, 1) >= self.prob:
                 return seq
@@ -5,7 +5,6 @@ from utils import get_msg_mgr, mkdir
 
 from .metric import mean_iou, cuda_dist, compute_ACC_mAP, evaluate_rank, evaluate_many
 from .re_rank import re_ranking
-from sklearn.metrics import confusion_matrix, accuracy_score
 
 def de_diag(acc, each_angle=False):
     # Exclude identical-view cases
@@ -417,6 +416,8 @@ def evaluate_CCPG(data, dataset, metric='euc'):
     return result_dict
 
 def evaluate_scoliosis(data, dataset, metric='euc'):
+    # imported here, not to load sklearn for the other datasets
+    from sklearn.metrics import confusion_matrix, accuracy_score
     msg_mgr = get_msg_mgr()
 
     feature, label, class_id, view = data['embeddings'], data['labels'], data['types'], data['views']
@@ -1,9 +1,12 @@
 
 import os
+import json
 import argparse
 import torch
+import numpy as np
 import torch.nn as nn
 from modeling import models
+from modeling.ensemble import run_ensemble_test
 from utils import config_loader, get_ddp_module, init_seeds, params_count, get_msg_mgr
 
 parser = argparse.ArgumentParser(description='Main program for opengait.')
@@ -14,10 +17,12 @@ parser.add_argument('--local-rank', type=int, default=0,
 parser.add_argument('--cfgs', type=str,
                     default='config/default.yaml', help="path of config file")
 parser.add_argument('--phase', default='train',
-                    choices=['train', 'test'], help="choose train or test phase")
+                    choices=['train', 'test', 'quant', 'ensemble', 'sweep'], help="choose train, test, quant, ensemble or sweep phase, quant compares the int8 model with the float32 one on cpu, ensemble tests the models listed in ensemble_cfg in one pass, sweep tests several checkpoints in one process")
 parser.add_argument('--log_to_file', action='store_true',
                     help="log to file, default path is: output/<dataset>/<model>/<save_name>/<logs>/<Datetime>.txt")
-parser.add_argument('--iter', default=0, help="iter to restore")
+parser.add_argument('--iter', default=0, help="iter to restore, comma separated iters or checkpoint paths to test in sweep phase")
+parser.add_argument('--result_file', type=str, default=None,
+                    help="save the test results in this json file, used by the background test of the training")
 opt = parser.parse_args()
 
 
@@ -28,7 +33,8 @@ def initialization(cfgs, training):
                                cfgs['model_cfg']['model'], engine_cfg['save_name'])
     if training:
         msg_mgr.init_manager(output_path, opt.log_to_file, engine_cfg['log_iter'],
-                             engine_cfg['restore_hint'] if isinstance(engine_cfg['restore_hint'], (int)) else 0)
+                             engine_cfg['restore_hint'] if isinstance(engine_cfg['restore_hint'], (int)) else 0,
+                             **engine_cfg['summary'])
     else:
         msg_mgr.init_logger(output_path, opt.log_to_file)
 
@@ -48,26 +54,45 @@ def run_model(cfgs, training):
         model = nn.SyncBatchNorm.convert_sync_batchnorm(model)
     if cfgs['trainer_cfg']['fix_BN']:
         model.fix_BN()
-    model = get_ddp_module(model, cfgs['trainer_cfg']['find_unused_parameters'])
+    if opt.phase != 'quant':
+        # the quantized blocks are swapped in after building, keep the plain module
+        model = get_ddp_module(model, cfgs['trainer_cfg']['find_unused_parameters'])
     msg_mgr.log_info(params_count(model))
     msg_mgr.log_info("Model Initialization Finished!")
 
     if training:
         Model.run_train(model)
+    elif opt.phase == 'quant':
+        Model.run_quant_test(model)
+    elif opt.phase == 'sweep':
+        Model.run_sweep(model)
     else:
-        Model.run_test(model)
+        result_dict = Model.run_test(model)
+        if opt.result_file is not None and result_dict:
+            with open(opt.result_file, 'w') as f:
+                json.dump({k: float(np.mean(v)) for k, v in result_dict.items() if k.startswith('scalar/')}, f)
 
 
 if __name__ == '__main__':
-    torch.distributed.init_process_group('nccl', init_method='env://')
-    if torch.distributed.get_world_size() != torch.cuda.device_count():
+    backend = 'nccl' if torch.cuda.is_available() else 'gloo'
+    torch.distributed.init_process_group(backend, init_method='env://')
+    if torch.cuda.is_available() and torch.distributed.get_world_size() != torch.cuda.device_count():
         raise ValueError("Expect number of available GPUs({}) equals to the world size({}).".format(
             torch.cuda.device_count(), torch.distributed.get_world_size()))
     cfgs = config_loader(opt.cfgs)
-    if opt.iter != 0:
+    if opt.phase == 'sweep':
+        if opt.iter != 0:
+            cfgs['evaluator_cfg']['sweep']['restore_hints'] = [
+                int(hint) if hint.isdigit() else hint for hint in str(opt.iter).split(',')]
+        # the checkpoints are restored one by one in the sweep
+        cfgs['evaluator_cfg']['restore_hint'] = 0
+    elif opt.iter != 0:
         cfgs['evaluator_cfg']['restore_hint'] = int(opt.iter)
         cfgs['trainer_cfg']['restore_hint'] = int(opt.iter)
 
     training = (opt.phase == 'train')
     initialization(cfgs, training)
-    run_model(cfgs, training)
+    if opt.phase == 'ensemble':
+        run_ensemble_test(cfgs)
+    else:
+        run_model(cfgs, training)
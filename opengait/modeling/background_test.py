@@ -0,0 +1,123 @@
+"""Test the checkpoints saved during the training in separate processes.
+
+With `with_test` and `background_test.enable`, each checkpoint is tested by `main.py --phase test` in a
+ subprocess on its own devices, e.g. a spare GPU or the CPU, instead of pausing the training. The results
+ are read back by the training process and written to its TensorBoard at the iteration of the checkpoint.
+ At most `max_running` tests run at once, the others wait for their turn, and the checkpoints to be tested are
+ kept from the retention of `keep_last_ckpts` until their tests finish.
+"""
+import os
+import sys
+import json
+import subprocess
+import os.path as osp
+import yaml
+import torch
+
+from utils import get_msg_mgr, mkdir
+
+__all__ = ['BackgroundTester']
+
+MAIN_PATH = osp.join(osp.dirname(osp.dirname(osp.abspath(__file__))), 'main.py')
+
+
+class BackgroundTester:
+    """Launch the test processes from rank 0 and collect their results.
+
+    A test is launched once its checkpoint is completely written, which is checked by `poll`, since the
+     checkpoint may be written in the background, see `CheckpointSaver`.
+    """
+
+    def __init__(self, cfgs, save_path, ckpt_saver, devices='', max_running=1):
+        """
+        Args:
+            ckpt_saver: the `CheckpointSaver` of the training, which keeps the checkpoints to be tested.
+            devices: the CUDA_VISIBLE_DEVICES of the test processes, empty for cpu.
+            max_running: the number of the test processes running at once.
+        """
+        self.msg_mgr = get_msg_mgr()
+        self.ckpt_saver = ckpt_saver
+        self.max_running = max(1, max_running)
+        self.enabled = torch.distributed.get_rank() == 0
+        self.work_path = osp.join(save_path, 'background_test/')
+        self.ckpt_path = osp.join(save_path, 'checkpoints/{}-{{:0>5}}.pt'.format(cfgs['trainer_cfg']['save_name']))
+        self.devices = str(devices)
+        self.nproc = len(self.devices.split(',')) if self.devices else 1
+        self.pending = []
+        self.running = []
+        if self.enabled:
+            mkdir(self.work_path)
+            # the merged config, not to be affected by any later edit of the config file
+            self.cfgs_path = osp.join(self.work_path, 'cfgs.yaml')
+            with open(self.cfgs_path, 'w') as f:
+                yaml.safe_dump(cfgs, f, default_flow_style=False)
+
+    def submit(self, iteration):
+        """Test the checkpoint of `iteration` once it is on the disk."""
+        if self.enabled:
+            self.ckpt_saver.pin(self.ckpt_path.format(iteration))
+            self.pending.append(iteration)
+
+    def _release(self, iteration):
+        self.ckpt_saver.release(self.ckpt_path.format(iteration))
+
+    def _launch(self, iteration):
+        result_file = osp.join(self.work_path, 'result-{:0>5}.json'.format(iteration))
+        log_file = open(osp.join(self.work_path, 'test-{:0>5}.log'.format(iteration)), 'w')
+        env = dict(os.environ, CUDA_VISIBLE_DEVICES=self.devices)
+        cmd = [sys.executable, '-m', 'torch.distributed.run', '--standalone', '--nproc_per_node=%d' % self.nproc,
+               MAIN_PATH, '--cfgs', self.cfgs_path, '--phase', 'test', '--iter', str(iteration),
+               '--result_file', result_file]
+        process = subprocess.Popen(cmd, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        self.running.append((iteration, process, log_file, result_file))
+        self.msg_mgr.log_info("Testing iteration {:0>5} in the background, log in {}".format(iteration, log_file.name))
+
+    def poll(self):
+        """Collect the finished tests and launch the ones of the saved checkpoints, up to `max_running`.
+
+        Returns:
+            list: (iteration, result_dict) of the finished tests.
+        """
+        if not self.enabled:
+            return []
+        finished = []
+        for job in list(self.running):
+            iteration, process, log_file, result_file = job
+            if process.poll() is None:
+                continue
+            self.running.remove(job)
+            log_file.close()
+            self._release(iteration)
+            if process.returncode != 0 or not osp.exists(result_file):
+                self.msg_mgr.log_warning("The background test of iteration {:0>5} failed with code {}, see {}".format(
+                    iteration, process.returncode, log_file.name))
+                continue
+            with open(result_file, 'r') as f:
+                result_dict = json.load(f)
+            self.msg_mgr.log_info("Background test of iteration {:0>5}: {}".format(iteration, ", ".join(
+                "{}={:.2f}".format(k.replace('scalar/', ''), v) for k, v in result_dict.items())))
+            finished.append((iteration, result_dict))
+
+        for iteration in list(self.pending):
+            if len(self.running) >= self.max_running:
+                break
+            if osp.exists(self.ckpt_path.format(iteration)):
+                self.pending.remove(iteration)
+                self._launch(iteration)
+        return finished
+
+    def wait(self):
+        """Wait for all the tests and collect their results, after all the checkpoints are written."""
+        if not self.enabled:
+            return []
+        finished = []
+        while True:
+            finished += self.poll()
+            for iteration in [i for i in self.pending if not osp.exists(self.ckpt_path.format(i))]:
+                self.msg_mgr.log_warning(
+                    "The checkpoint of iteration {:0>5} is not found, skip its background test.".format(iteration))
+                self.pending.remove(iteration)
+                self._release(iteration)
+            if len(self.running) == 0:
+                return finished
+            self.running[0][1].wait()
@@ -9,6 +9,8 @@ Typical usage:
 BaseModel.run_train(model)
 BaseModel.run_test(model)
 """
+import os
+import time
 import torch
 import numpy as np
 import os.path as osp
@@ -17,25 +19,38 @@ import torch.optim as optim
 import torch.utils.data as tordata
 
 from tqdm import tqdm
-from torch.cuda.amp import autocast
+from fnmatch import fnmatch
+from contextlib import ExitStack
 from torch.cuda.amp import GradScaler
+from torch.nn.parallel import DistributedDataParallel as DDP
 from abc import ABCMeta
 from abc import abstractmethod
 
 from . import backbones
 from .loss_aggregator import LossAggregator
+from .modules import SetBlockWrapper, checkpoint_module
+from .background_test import BackgroundTester
 from data.transform import get_transform
 from data.collate_fn import CollateFn
 from data.dataset import DataSet
+from data.cached_loader import CachedLoader
 import data.sampler as Samplers
 from utils import Odict, mkdir, ddp_all_gather
-from utils import get_valid_args, is_list, is_dict, np2var, ts2np, list2var, get_attr_from
+from utils import get_valid_args, is_list, is_dict, is_tensor, np2var, ts2np, list2var, get_attr_from, record_syncs
 from evaluation import evaluator as eval_functions
-from utils import NoOp
+from utils import NoOp, StageTimer, CheckpointSaver, ModuleProfiler
 from utils import get_msg_mgr
 
 __all__ = ['BaseModel']
 
+shared_test_loaders = {}
+
+precisions_map = {
+    'fp32': torch.float32,
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16
+}
+
 
 class MetaModel(metaclass=ABCMeta):
     """The necessary functions for the base model.
@@ -117,6 +132,9 @@ class BaseModel(MetaModel, nn.Module):
 
     """
 
+    # Whether the model keeps the sequences apart when a testing batch of each GPU holds more than one of them.
+    batched_inference = False
+
     def __init__(self, cfgs, training):
         """Initialize the base model.
 
@@ -133,43 +151,100 @@ class BaseModel(MetaModel, nn.Module):
         self.msg_mgr = get_msg_mgr()
         self.cfgs = cfgs
         self.iteration = 0
+        # the host time of the forwards of `inference_batch`, e.g. for the speed of the quant phase on cpu
+        self.forward_seconds = 0.
+        # set by the trainer, True only on the iterations whose `visual_summary` is written
+        self.should_log_visuals = False
         self.engine_cfg = cfgs['trainer_cfg'] if training else cfgs['evaluator_cfg']
         if self.engine_cfg is None:
             raise Exception("Initialize a model without -Engine-Cfgs-")
 
-        if training and self.engine_cfg['enable_float16']:
-            self.Scaler = GradScaler()
         self.save_path = osp.join('output/', cfgs['data_cfg']['dataset_name'],
                                   cfgs['model_cfg']['model'], self.engine_cfg['save_name'])
+        self.small_loss_steps = 0
+        if training:
+            self.accumulation_steps = self.engine_cfg['accumulation_steps']
+            self.accumulated = 0
+            self.ckpt_saver = CheckpointSaver(self.engine_cfg['async_save'], self.engine_cfg['keep_last_ckpts'])
+            self.background_tester = None
+            if self.engine_cfg['with_test'] and self.engine_cfg['background_test']['enable']:
+                background_cfg = self.engine_cfg['background_test']
+                self.background_tester = BackgroundTester(
+                    cfgs, self.save_path, self.ckpt_saver, background_cfg['devices'], background_cfg['max_running'])
+        self.timer = StageTimer(training and self.engine_cfg['stage_timing'])
+        self.precision = self.get_precision(self.engine_cfg)
+        if training and self.precision == 'fp16':
+            # bf16 shares the exponent range of fp32, no need to scale the loss.
+            self.Scaler = GradScaler()
 
         self.build_network(cfgs['model_cfg'])
+        # all the parameters are overwritten by a checkpoint loaded strictly, no need to initialize them
+        self.skip_init = self.engine_cfg['restore_hint'] != 0 and self.engine_cfg['restore_ckpt_strict']
         self.init_parameters()
+        if cfgs['model_cfg'].get('checkpointing'):
+            self.apply_checkpointing(cfgs['model_cfg']['checkpointing'])
         self.trainer_trfs = get_transform(cfgs['trainer_cfg']['transform'])
 
         self.msg_mgr.log_info(cfgs['data_cfg'])
         if training:
             self.train_loader = self.get_loader(
                 cfgs['data_cfg'], train=True)
-        if not training or self.engine_cfg['with_test']:
+        if not training or (self.engine_cfg['with_test'] and self.background_tester is None):
             self.test_loader = self.get_loader(
                 cfgs['data_cfg'], train=False)
             self.evaluator_trfs = get_transform(
                 cfgs['evaluator_cfg']['transform'])
 
-        self.device = torch.distributed.get_rank()
-        torch.cuda.set_device(self.device)
-        self.to(device=torch.device(
-            "cuda", self.device))
+        if torch.cuda.is_available():
+            self.device = torch.device("cuda", torch.distributed.get_rank())
+            torch.cuda.set_device(self.device)
+        else:
+            self.device = torch.device("cpu")
+        self.to(device=self.device)
+        if self.engine_cfg['channels_last']:
+            self.apply_channels_last()
 
         if training:
             self.loss_aggregator = LossAggregator(cfgs['loss_cfg'])
+            sharded = [name for name, p in self.named_parameters() if getattr(p, 'sharded', False)]
+            if len(sharded) > 0:
+                # kept by each rank, e.g. the class centres of PartialFCLoss
+                DDP._set_params_and_buffers_to_ignore_for_model(self, sharded)
             self.optimizer = self.get_optimizer(self.cfgs['optimizer_cfg'])
             self.scheduler = self.get_scheduler(cfgs['scheduler_cfg'])
         self.train(training)
+        self.profiler = None
+        if training and self.engine_cfg['profile']['enable']:
+            if self.engine_cfg['compile']['enable']:
+                self.msg_mgr.log_warning("The profiler hooks the eager forward, disable the compile to profile the modules.")
+            profile_cfg = self.engine_cfg['profile']
+            self.profiler = ModuleProfiler(self, profile_cfg['modules'], profile_cfg['skip_iters'],
+                                           profile_cfg['iters'], self.save_path)
+        if self.engine_cfg['compile']['enable']:
+            self.apply_compile(self.engine_cfg['compile'], self.engine_cfg['sampler'], training)
         restore_hint = self.engine_cfg['restore_hint']
         if restore_hint != 0:
             self.resume_ckpt(restore_hint)
 
+    def get_precision(self, engine_cfg):
+        """Get the precision of the engine, `fp32`, `fp16` or `bf16`.
+
+        The `precision` setting is preferred, and `enable_float16` is used if it is not given.
+        """
+        if 'precision' in engine_cfg.keys():
+            precision = engine_cfg['precision']
+        else:
+            precision = 'fp16' if engine_cfg['enable_float16'] else 'fp32'
+        if precision not in precisions_map.keys():
+            raise ValueError("Error type for -Precision-, supported: {}, but got {}.".format(
+                list(precisions_map.keys()), precision))
+        return precision
+
+    def autocast(self):
+        """Get the device-generic autocast context of the precision setting."""
+        return torch.autocast(device_type=self.device.type, dtype=precisions_map[self.precision],
+                              enabled=self.precision != 'fp32')
+
     def get_backbone(self, backbone_cfg):
         """Get the backbone of the model."""
         if is_dict(backbone_cfg):
@@ -187,7 +262,92 @@ class BaseModel(MetaModel, nn.Module):
         if 'backbone_cfg' in model_cfg.keys():
             self.Backbone = self.get_backbone(model_cfg['backbone_cfg'])
 
+    def apply_channels_last(self):
+        """Keep the frame-level 2D stacks in the channels_last (NHWC) memory format.
+
+        The weights of the 2D convolutions are converted, and the `SetBlockWrapper`s pass the frames in NHWC
+         between each other without any copy.
+        """
+        for m in self.modules():
+            if isinstance(m, nn.Conv2d):
+                m.to(memory_format=torch.channels_last)
+            elif isinstance(m, SetBlockWrapper):
+                m.channels_last = True
+        self.msg_mgr.log_info("Use the channels_last memory format.")
+
+    def apply_compile(self, compile_cfg, sampler_cfg, training):
+        """Compile the forward (and optionally the loss aggregator) by `torch.compile`.
+
+        The forward is replaced in place, so the names of the parameters, and hence the checkpoints, are unchanged.
+        """
+        if compile_cfg['cache_dir']:
+            # reuse the compiled kernels and graphs of the former launches
+            os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', osp.abspath(compile_cfg['cache_dir']))
+            os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+        dynamic = compile_cfg['dynamic']
+        if dynamic == 'auto':
+            # the frame number varies with the unfixed and all sampling
+            dynamic = not sampler_cfg['sample_type'].startswith('fixed')
+        compile_args = {'mode': compile_cfg['mode'], 'dynamic': dynamic}
+
+        forward = self.forward
+        compiled_forward = torch.compile(forward, **compile_args)
+        reported = not compile_cfg['report_graph_breaks']
+
+        def checked_forward(*args, **kwargs):
+            nonlocal reported
+            if not reported:
+                reported = True
+                self.report_graph_breaks(forward, *args, **kwargs)
+            return compiled_forward(*args, **kwargs)
+        self.forward = checked_forward
+        if training and compile_cfg['loss']:
+            self.loss_aggregator.forward = torch.compile(self.loss_aggregator.forward, **compile_args)
+        self.msg_mgr.log_info("Compiled the forward with %s." % compile_args)
+
+    def report_graph_breaks(self, forward, *args, **kwargs):
+        """Log the graph breaks of the forward on the first inputs, which costs one more forward.
+
+        The extra forward runs in eval mode without gradients, so the running statistics of the BatchNorm layers
+         are not updated twice and no dropout is sampled, and the training modes are restored after it.
+        """
+        modes = [(m, m.training) for m in self.modules()]
+        self.eval()
+        try:
+            with torch.no_grad():
+                explanation = torch._dynamo.explain(forward)(*args, **kwargs)
+        finally:
+            for m, mode in modes:
+                m.training = mode
+        string = "-------- Graph Breaks --------\nGraphs: {}, graph breaks: {}".format(
+            explanation.graph_count, explanation.graph_break_count)
+        for reason in explanation.break_reasons:
+            frame = reason.user_stack[-1] if reason.user_stack else None
+            string += "\n{}{}".format(reason.reason, ' at %s:%d' % (frame.filename, frame.lineno) if frame else '')
+        self.msg_mgr.log_info(string)
+
+    def apply_checkpointing(self, patterns):
+        """Apply the activation checkpointing to the sub-modules matching the patterns.
+
+        Args:
+            patterns: list of the module names, e.g. `layer3`, the unix shell-style wildcards, e.g. `Backbone.layers.*`,
+                or the class names, e.g. `SetBlockWrapper`. The outermost matched modules are checkpointed.
+        """
+        if not is_list(patterns):
+            patterns = [patterns]
+        checkpointed = []
+        for name, module in self.named_modules():
+            if name == '' or any(name.startswith(ckpt + '.') for ckpt in checkpointed):
+                continue
+            if any(fnmatch(name, pat) or type(module).__name__ == pat for pat in patterns):
+                checkpoint_module(module)
+                checkpointed.append(name)
+        self.msg_mgr.log_info("-------- Checkpointed Modules --------")
+        self.msg_mgr.log_info(checkpointed)
+
     def init_parameters(self):
+        if self.skip_init:
+            return
         for m in self.modules():
             if isinstance(m, (nn.Conv3d, nn.Conv2d, nn.Conv1d)):
                 nn.init.xavier_uniform_(m.weight.data)
@@ -204,6 +364,15 @@ class BaseModel(MetaModel, nn.Module):
 
     def get_loader(self, data_cfg, train=True):
         sampler_cfg = self.cfgs['trainer_cfg']['sampler'] if train else self.cfgs['evaluator_cfg']['sampler']
+        if not train:
+            # the test loader is deterministic, share it among the models built in this process, e.g. an ensemble.
+            loader_key = repr((data_cfg, sampler_cfg))
+            if loader_key not in shared_test_loaders:
+                shared_test_loaders[loader_key] = self._build_loader(data_cfg, sampler_cfg, train)
+            return shared_test_loaders[loader_key]
+        return self._build_loader(data_cfg, sampler_cfg, train)
+
+    def _build_loader(self, data_cfg, sampler_cfg, train):
         dataset = DataSet(data_cfg, train)
 
         Sampler = get_attr_from([Samplers], sampler_cfg['type'])
@@ -235,23 +404,45 @@ class BaseModel(MetaModel, nn.Module):
         return scheduler
 
     def save_ckpt(self, iteration):
+        model_state_dict = self.state_dict()
+        # on all the ranks, to gather the sharded parameters, e.g. the class centres of PartialFCLoss
+        for name, module in self.named_modules():
+            if hasattr(module, 'gather_state_dict'):
+                module.gather_state_dict(model_state_dict, name + '.')
         if torch.distributed.get_rank() == 0:
             mkdir(osp.join(self.save_path, "checkpoints/"))
             save_name = self.engine_cfg['save_name']
             checkpoint = {
-                'model': self.state_dict(),
+                'model': model_state_dict,
                 'optimizer': self.optimizer.state_dict(),
                 'scheduler': self.scheduler.state_dict(),
                 'iteration': iteration}
-            torch.save(checkpoint,
-                       osp.join(self.save_path, 'checkpoints/{}-{:0>5}.pt'.format(save_name, iteration)))
+            self.ckpt_saver.save(checkpoint,
+                                 osp.join(self.save_path, 'checkpoints/{}-{:0>5}.pt'.format(save_name, iteration)))
+
+    @staticmethod
+    def load_checkpoint_file(save_name):
+        """Load the checkpoint memory-mapped on the host.
+
+        The tensors are read from the file only when used, e.g. the optimizer states are never read in testing,
+         and each one is copied to the device once, into the parameter or the optimizer state it is loaded into.
+        """
+        try:
+            return torch.load(save_name, map_location='cpu', mmap=True, weights_only=False)
+        except (TypeError, RuntimeError):
+            # torch < 2.1, or the legacy format which can not be memory-mapped
+            return torch.load(save_name, map_location='cpu')
 
     def _load_ckpt(self, save_name):
         load_ckpt_strict = self.engine_cfg['restore_ckpt_strict']
 
-        checkpoint = torch.load(save_name, map_location=torch.device(
-            "cuda", self.device))
+        checkpoint = self.load_checkpoint_file(save_name)
         model_state_dict = checkpoint['model']
+        if not self.training:
+            # the parameters of the losses, e.g. the class centres of PartialFCLoss, are for training only
+            for k in [k for k in model_state_dict.keys() if k.startswith('loss_aggregator.')]:
+                model_state_dict.pop(k)
+            checkpoint.pop('optimizer', None)
 
         if not load_ckpt_strict:
             self.msg_mgr.log_info("-------- Restored Params List --------")
@@ -262,6 +453,10 @@ class BaseModel(MetaModel, nn.Module):
         if self.training:
             if not self.engine_cfg["optimizer_reset"] and 'optimizer' in checkpoint:
                 self.optimizer.load_state_dict(checkpoint['optimizer'])
+                # the checkpoint holds the optimizer states of the sharded parameters of rank 0 only
+                for p in self.parameters():
+                    if getattr(p, 'sharded', False) and self.optimizer.state.pop(p, None) is not None:
+                        self.msg_mgr.log_warning("Reset the optimizer states of the sharded parameters.")
             else:
                 self.msg_mgr.log_warning(
                     "Restore NO Optimizer from %s !!!" % save_name)
@@ -316,36 +511,66 @@ class BaseModel(MetaModel, nn.Module):
         labs = list2var(labs_batch).long()
 
         if seqL_batch is not None:
-            seqL_batch = np2var(seqL_batch).int()
+            # kept on the host, it only drives the python logic like the sequence splitting
+            seqL_batch = torch.from_numpy(seqL_batch).int()
         seqL = seqL_batch
 
         if seqL is not None:
-            seqL_sum = int(seqL.sum().data.cpu().numpy())
+            seqL_sum = int(seqL.sum())
             ipts = [_[:, :seqL_sum] for _ in seqs]
         else:
             ipts = seqs
         del seqs
         return ipts, labs, typs, vies, seqL
 
+    def set_log_visuals(self, flag):
+        """Tell the next forward whether its `visual_summary` is written.
+
+        Set on the model itself, not on the DDP wrapper. The costly visual summaries, e.g. the PCA of BigGait,
+         are only computed when `self.should_log_visuals` is True, or returned as callables which are only called
+         when written by `MessageManager`. Never set for the inference.
+        """
+        self.should_log_visuals = flag
+
     def train_step(self, loss_sum) -> bool:
         """Conduct loss_sum.backward(), self.optimizer.step() and self.scheduler.step().
 
+        With `accumulation_steps` > 1, the gradients of the micro-batches are accumulated, and the optimizer steps
+         on the last micro-batch of every `accumulation_steps` ones only.
+
         Args:
             loss_sum:The loss of the current batch.
         Returns:
-            bool: True if the training is finished, False otherwise.
+            bool: True if the optimizer stepped, False if it skipped the step or is accumulating the gradients.
         """
 
-        self.optimizer.zero_grad()
-        if loss_sum <= 1e-9:
-            self.msg_mgr.log_warning(
-                "Find the loss sum less than 1e-9 but the training process will continue!")
-
-        if self.engine_cfg['enable_float16']:
-            self.Scaler.scale(loss_sum).backward()
-            self.Scaler.step(self.optimizer)
-            scale = self.Scaler.get_scale()
-            self.Scaler.update()
+        if self.accumulated == 0:
+            self.optimizer.zero_grad()
+        if is_tensor(loss_sum):
+            # counted on the device and checked per `log_iter` iterations, not to sync per iteration.
+            self.small_loss_steps = self.small_loss_steps + (loss_sum.detach() <= 1e-9).int()
+        if self.accumulation_steps > 1:
+            loss_sum = loss_sum / self.accumulation_steps
+
+        self.accumulated += 1
+        if self.accumulated < self.accumulation_steps:
+            with self.timer.stage('backward'):
+                if self.precision == 'fp16':
+                    self.Scaler.scale(loss_sum).backward()
+                else:
+                    loss_sum.backward()
+            return False
+        self.accumulated = 0
+        # the next accumulated batch is mined apart from this one
+        self.loss_aggregator.reset_memory()
+
+        if self.precision == 'fp16':
+            with self.timer.stage('backward'):
+                self.Scaler.scale(loss_sum).backward()
+            with self.timer.stage('optimizer'):
+                self.Scaler.step(self.optimizer)
+                scale = self.Scaler.get_scale()
+                self.Scaler.update()
             # Warning caused by optimizer skip when NaN
             # https://discuss.pytorch.org/t/optimizer-step-before-lr-scheduler-step-error-using-gradscaler/92930/5
             if scale != self.Scaler.get_scale():
@@ -353,40 +578,32 @@ class BaseModel(MetaModel, nn.Module):
                     scale, self.Scaler.get_scale()))
                 return False
         else:
-            loss_sum.backward()
-            self.optimizer.step()
+            with self.timer.stage('backward'):
+                loss_sum.backward()
+            with self.timer.stage('optimizer'):
+                self.optimizer.step()
 
         self.iteration += 1
-        self.scheduler.step()
+        with self.timer.stage('optimizer', host=True):
+            self.scheduler.step()
+        if self.iteration % self.engine_cfg['log_iter'] == 0 and int(self.small_loss_steps) > 0:
+            self.msg_mgr.log_warning(
+                "Find the loss sum less than 1e-9 in %d iterations but the training process will continue!" % int(self.small_loss_steps))
+            self.small_loss_steps = 0
         return True
 
-    def inference(self, rank):
-        """Inference all the test data.
-
-        Args:
-            rank: the rank of the current process.Transform
-        Returns:
-            Odict: contains the inference results.
-        """
-        total_size = len(self.test_loader)
+    @staticmethod
+    def iter_test_batches(loader, rank):
+        """Iterate the batches of the test loader, with the progress bar on rank 0."""
+        total_size = len(loader)
         if rank == 0:
             pbar = tqdm(total=total_size, desc='Transforming')
         else:
             pbar = NoOp()
-        batch_size = self.test_loader.batch_sampler.batch_size
+        batch_size = loader.batch_sampler.batch_size
         rest_size = total_size
-        info_dict = Odict()
-        for inputs in self.test_loader:
-            ipts = self.inputs_pretreament(inputs)
-            with autocast(enabled=self.engine_cfg['enable_float16']):
-                retval = self.forward(ipts)
-                inference_feat = retval['inference_feat']
-                for k, v in inference_feat.items():
-                    inference_feat[k] = ddp_all_gather(v, requires_grad=False)
-                del retval
-            for k, v in inference_feat.items():
-                inference_feat[k] = ts2np(v)
-            info_dict.append(inference_feat)
+        for inputs in loader:
+            yield inputs
             rest_size -= batch_size
             if rest_size >= 0:
                 update_size = batch_size
@@ -394,35 +611,103 @@ class BaseModel(MetaModel, nn.Module):
                 update_size = total_size % batch_size
             pbar.update(update_size)
         pbar.close()
+
+    def inference_batch(self, inputs):
+        """Inference one collated test batch.
+
+        Returns:
+            dict: the inference features of the batches of all the ranks, in numpy.
+        """
+        ipts = self.inputs_pretreament(inputs)
+        with self.autocast():
+            start = time.perf_counter()
+            retval = self.forward(ipts)
+            self.forward_seconds += time.perf_counter() - start
+            inference_feat = retval['inference_feat']
+            for k, v in inference_feat.items():
+                inference_feat[k] = ddp_all_gather(v, requires_grad=False)
+            del retval
+        for k, v in inference_feat.items():
+            inference_feat[k] = ts2np(v)
+        return inference_feat
+
+    @staticmethod
+    def concat_inference(info_dict, total_size):
+        """Concatenate the features of the batches, without the ones padded by the sampler."""
         for k, v in info_dict.items():
-            v = np.concatenate(v)[:total_size]
-            info_dict[k] = v
+            info_dict[k] = np.concatenate(v)[:total_size]
         return info_dict
 
+    def inference(self, rank):
+        """Inference all the test data.
+
+        Args:
+            rank: the rank of the current process.Transform
+        Returns:
+            Odict: contains the inference results.
+        """
+        info_dict = Odict()
+        for inputs in self.iter_test_batches(self.test_loader, rank):
+            info_dict.append(self.inference_batch(inputs))
+        return self.concat_inference(info_dict, len(self.test_loader))
+
     @ staticmethod
     def run_train(model):
         """Accept the instance object(model) here, and then run the train loop."""
-        for inputs in model.train_loader:
-            ipts = model.inputs_pretreament(inputs)
-            with autocast(enabled=model.engine_cfg['enable_float16']):
-                retval = model(ipts)
-                training_feat, visual_summary = retval['training_feat'], retval['visual_summary']
-                del retval
-            loss_sum, loss_info = model.loss_aggregator(training_feat)
-            ok = model.train_step(loss_sum)
+        sync_debug = model.engine_cfg['sync_debug']
+        timer = model.timer
+        timer.reset()
+        for inputs in timer.time_iter(model.train_loader, 'data'):
+            with record_syncs(sync_debug) as syncs, ExitStack() as stack:
+                if model.accumulated + 1 < model.accumulation_steps:
+                    # no gradient all-reduce until the last micro-batch
+                    for module in [model] + list(model.loss_aggregator.losses.values()):
+                        if isinstance(module, DDP):
+                            stack.enter_context(module.no_sync())
+                if model.profiler is not None:
+                    model.profiler.step(model.iteration)
+                with timer.stage('pretreatment', host=True):
+                    ipts = model.inputs_pretreament(inputs)
+                # the summary of the last micro-batch is written by rank 0 every `log_iter` iterations
+                model.set_log_visuals(torch.distributed.get_rank() == 0 and model.accumulated + 1 >= model.accumulation_steps
+                                      and (model.iteration + 1) % model.engine_cfg['log_iter'] == 0)
+                with model.autocast():
+                    with timer.stage('forward'):
+                        retval = model(ipts)
+                        training_feat, visual_summary = retval['training_feat'], retval['visual_summary'] or {}
+                        del retval
+                    with timer.stage('loss'):
+                        loss_sum, loss_info = model.loss_aggregator(training_feat)
+                ok = model.train_step(loss_sum)
+            if len(syncs) > 0:
+                model.msg_mgr.log_warning("Iteration {:0>5}, {} host-device syncs at:\n{}".format(
+                    model.iteration, len(syncs), '\n'.join(syncs)))
+            # counted on the collated batch, which is still on the host
+            seqL_batch = inputs[4]
+            timer.count(len(inputs[1]), int(np.sum(seqL_batch)) if seqL_batch is not None else sum(len(seq) for seq in inputs[0][0]),
+                        step=model.accumulated == 0)
             if not ok:
                 continue
 
             visual_summary.update(loss_info)
             visual_summary['scalar/learning_rate'] = model.optimizer.param_groups[0]['lr']
+            if model.iteration % model.engine_cfg['log_iter'] == 0:
+                timing = timer.summary()
+                if timing:
+                    visual_summary.update(timing)
+                    model.msg_mgr.log_info("Iteration {:0>5}, ".format(model.iteration) + ", ".join(
+                        "{}={:.2f}".format(k.replace('scalar/', '').split('/')[-1], v) for k, v in timing.items()))
 
             model.msg_mgr.train_step(loss_info, visual_summary)
             if model.iteration % model.engine_cfg['save_iter'] == 0:
                 # save the checkpoint
-                model.save_ckpt(model.iteration)
+                with timer.stage('checkpoint', host=True):
+                    model.save_ckpt(model.iteration)
 
                 # run test if with_test = true
-                if model.engine_cfg['with_test']:
+                if model.background_tester is not None:
+                    model.background_tester.submit(model.iteration)
+                elif model.engine_cfg['with_test']:
                     model.msg_mgr.log_info("Running test...")
                     model.eval()
                     result_dict = BaseModel.run_test(model)
@@ -432,37 +717,161 @@ class BaseModel(MetaModel, nn.Module):
                     if result_dict:
                         model.msg_mgr.write_to_tensorboard(result_dict)
                     model.msg_mgr.reset_time()
+                    timer.reset()
+            if model.background_tester is not None:
+                for iteration, result_dict in model.background_tester.poll():
+                    model.msg_mgr.write_to_tensorboard(result_dict, iteration)
             if model.iteration >= model.engine_cfg['total_iter']:
                 break
+        # the last checkpoint is written before leaving
+        model.ckpt_saver.wait()
+        if model.profiler is not None:
+            # the training ends within the window
+            model.profiler.close()
+        if model.background_tester is not None:
+            model.msg_mgr.log_info("Waiting for the background tests...")
+            for iteration, result_dict in model.background_tester.wait():
+                model.msg_mgr.write_to_tensorboard(result_dict, iteration)
+            model.msg_mgr.flush()
+        # the summaries and logs queued for the writer thread
+        model.msg_mgr.wait()
 
     @ staticmethod
     def run_test(model):
         """Accept the instance object(model) here, and then run the test loop."""
         evaluator_cfg = model.cfgs['evaluator_cfg']
-        if torch.distributed.get_world_size() != evaluator_cfg['sampler']['batch_size']:
+        if not model.batched_inference and torch.distributed.get_world_size() != evaluator_cfg['sampler']['batch_size']:
             raise ValueError("The batch size ({}) must be equal to the number of GPUs ({}) in testing mode!".format(
                 evaluator_cfg['sampler']['batch_size'], torch.distributed.get_world_size()))
         rank = torch.distributed.get_rank()
         with torch.no_grad():
             info_dict = model.inference(rank)
         if rank == 0:
-            loader = model.test_loader
-            label_list = loader.dataset.label_list
-            types_list = loader.dataset.types_list
-            views_list = loader.dataset.views_list
+            return BaseModel.evaluate(model, info_dict)
 
-            info_dict.update({
-                'labels': label_list, 'types': types_list, 'views': views_list})
+    @ staticmethod
+    def evaluate(model, info_dict, evaluator_cfg=None):
+        """Accept the instance object(model) and its inference results here, and then run the evaluation function.
 
-            if 'eval_func' in evaluator_cfg.keys():
-                eval_func = evaluator_cfg["eval_func"]
-            else:
-                eval_func = 'identification'
-            eval_func = getattr(eval_functions, eval_func)
-            valid_args = get_valid_args(
-                eval_func, evaluator_cfg, ['metric'])
-            try:
-                dataset_name = model.cfgs['data_cfg']['test_dataset_name']
-            except:
-                dataset_name = model.cfgs['data_cfg']['dataset_name']
-            return eval_func(info_dict, dataset_name, **valid_args)
+        The `eval_func` and `metric` are taken from `evaluator_cfg` if given, e.g. the one of an ensemble, or from the model.
+        """
+        if evaluator_cfg is None:
+            evaluator_cfg = model.cfgs['evaluator_cfg']
+        loader = model.test_loader
+        label_list = loader.dataset.label_list
+        types_list = loader.dataset.types_list
+        views_list = loader.dataset.views_list
+
+        info_dict.update({
+            'labels': label_list, 'types': types_list, 'views': views_list})
+
+        if 'eval_func' in evaluator_cfg.keys():
+            eval_func = evaluator_cfg["eval_func"]
+        else:
+            eval_func = 'identification'
+        eval_func = getattr(eval_functions, eval_func)
+        valid_args = get_valid_args(
+            eval_func, evaluator_cfg, ['metric'])
+        try:
+            dataset_name = model.cfgs['data_cfg']['test_dataset_name']
+        except:
+            dataset_name = model.cfgs['data_cfg']['dataset_name']
+        return eval_func(info_dict, dataset_name, **valid_args)
+
+    @ staticmethod
+    def run_sweep(model):
+        """Accept the instance object(model) here, and then test the checkpoints in `evaluator_cfg.sweep.restore_hints` one by one.
+
+        The model and the test loader are built only once, the checkpoints are hot-swapped into the model.
+        """
+        evaluator_cfg = model.cfgs['evaluator_cfg']
+        sweep_cfg = evaluator_cfg['sweep']
+        restore_hints = sweep_cfg['restore_hints']
+        if len(restore_hints) == 0:
+            raise ValueError(
+                "No checkpoint to sweep, please set `evaluator_cfg.sweep.restore_hints` or pass `--iter 20000,40000,...`!")
+        if sweep_cfg['cache_inputs']:
+            # set on the wrapped model, where `inference` looks for the loader
+            module = model.module if hasattr(model, 'module') else model
+            module.test_loader = CachedLoader(module.test_loader)
+
+        results = Odict()
+        for restore_hint in restore_hints:
+            model.resume_ckpt(restore_hint)
+            model.msg_mgr.log_info("Running test of %s..." % restore_hint)
+            result_dict = BaseModel.run_test(model)
+            if torch.distributed.get_rank() == 0:
+                results[restore_hint] = result_dict
+
+        if torch.distributed.get_rank() == 0:
+            keys = [k for k, v in results[restore_hints[0]].items()
+                    if np.asarray(v).dtype.kind in 'iuf']
+            rows = [['checkpoint'] + [k.replace('scalar/', '') for k in keys]]
+            for restore_hint, result_dict in results.items():
+                rows.append([str(restore_hint)] + ['{:.2f}'.format(float(np.mean(result_dict[k]))) for k in keys])
+            widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+            string = "-------- Sweep Report --------"
+            for row in rows:
+                string += "\n" + " | ".join(c.rjust(w) for c, w in zip(row, widths))
+            model.msg_mgr.log_info(string)
+
+            mkdir(model.save_path)
+            with open(osp.join(model.save_path, 'sweep.csv'), 'w') as f:
+                f.write("\n".join(",".join(row) for row in rows) + "\n")
+            model.msg_mgr.log_info(
+                "Sweep report saved in %s" % osp.join(model.save_path, 'sweep.csv'))
+        return results
+
+    @ staticmethod
+    def run_quant_test(model):
+        """Accept the instance object(model) here, quantize it to int8 and compare it with the float32 one on cpu."""
+        # imported here, torch.fx is only needed by the quant phase
+        from .quantization import prepare_quantization, calibrate, convert_quantization
+        evaluator_cfg = model.cfgs['evaluator_cfg']
+        quant_cfg = evaluator_cfg['quantization']
+        if model.device.type != 'cpu':
+            raise ValueError(
+                "The int8 model runs on cpu only, please hide the GPUs by CUDA_VISIBLE_DEVICES='' in quant mode!")
+        if not model.batched_inference and torch.distributed.get_world_size() != evaluator_cfg['sampler']['batch_size']:
+            raise ValueError("The batch size ({}) must be equal to the number of processes ({}) in quant mode!".format(
+                evaluator_cfg['sampler']['batch_size'], torch.distributed.get_world_size()))
+        if evaluator_cfg['compile']['enable']:
+            raise ValueError("The quantized blocks are swapped into the eager forward, "
+                             "please disable `evaluator_cfg.compile` in quant mode!")
+        model.eval()
+
+        results = {}
+        for precision in ['float32', 'int8']:
+            if precision == 'int8':
+                model.msg_mgr.log_info("Calibrating...")
+                blocks = prepare_quantization(
+                    model, model.test_loader, quant_cfg['backend'], quant_cfg['modules'])
+                calibrate(model, model.test_loader,
+                          quant_cfg['calibration_seqs'])
+                convert_quantization(model, blocks)
+            model.msg_mgr.log_info("Running %s test..." % precision)
+            # set on the wrapped model, where `inference_batch` counts it
+            module = model.module if hasattr(model, 'module') else model
+            module.forward_seconds = 0.
+            start = time.perf_counter()
+            with torch.no_grad():
+                info_dict = model.inference(torch.distributed.get_rank())
+            cost = time.perf_counter() - start
+            seqs_num = len(model.test_loader.dataset)
+            if torch.distributed.get_rank() == 0:
+                result_dict = BaseModel.evaluate(model, info_dict)
+                # the forwards only, without the loading, the collation and the gathering across the processes
+                result_dict['scalar/test_speed/forward_seqs_per_second'] = seqs_num / module.forward_seconds
+                result_dict['scalar/test_speed/seqs_per_second'] = seqs_num / cost
+                results[precision] = result_dict
+
+        if torch.distributed.get_rank() == 0:
+            string = "-------- Quantization Report --------"
+            for k in results['float32'].keys():
+                try:
+                    string += "\n{}: float32={:.2f}, int8={:.2f}".format(
+                        k.replace('scalar/', ''), float(np.mean(results['float32'][k])), float(np.mean(results['int8'][k])))
+                except (TypeError, ValueError):
+                    continue
+            model.msg_mgr.log_info(string)
+            return results
@@ -0,0 +1,151 @@
+"""Multi-model ensemble test with a shared data loader.
+
+Every batch of the test set is loaded, decoded and collated once and then fed to all the member
+ models, each with its own evaluator transforms. The per-model embeddings are evaluated one by one
+ with the `eval_func` and `metric` of each member config, as its standalone test, and fused into a
+ single embedding evaluated with the ones of the ensemble config, see `fuse_embeddings`.
+
+The ensemble config holds the shared `data_cfg` and `evaluator_cfg`, and lists the members:
+
+ensemble_cfg:
+  members:
+    - name: DeepGaitV2
+      cfgs: ./configs/deepgaitv2/DeepGaitV2_gait3d.yaml
+      inputs: [1] # the indices of the loaded data (`data_in_use`) fed to this model
+      weight: 1.0
+      restore_hint: 60000 # optional, overrides the one in the member config
+"""
+import os.path as osp
+import numpy as np
+import torch
+
+from . import models
+from .base_model import BaseModel
+from utils import Odict, config_loader, get_msg_mgr, mkdir
+
+__all__ = ['build_members', 'inference', 'fuse_embeddings', 'run_ensemble_test']
+
+
+def build_members(cfgs):
+    """Build the member models, sharing the data and sampler settings of the ensemble config.
+
+    Each member keeps the rest of its own `evaluator_cfg`, e.g. its transforms, `eval_func` and `metric`.
+
+    Args:
+        cfgs: the ensemble config.
+    Returns:
+        Odict: the member models, keyed by their names.
+    """
+    msg_mgr = get_msg_mgr()
+    evaluator_cfg = cfgs['evaluator_cfg']
+    members = Odict()
+    for member_cfg in cfgs['ensemble_cfg']['members']:
+        member_cfgs = config_loader(member_cfg['cfgs'])
+        # the same data and sampler settings let all the members share one test loader
+        member_cfgs['data_cfg'] = cfgs['data_cfg']
+        member_cfgs['evaluator_cfg']['sampler'] = evaluator_cfg['sampler']
+        if 'restore_hint' in member_cfg:
+            member_cfgs['evaluator_cfg']['restore_hint'] = member_cfg['restore_hint']
+
+        name = member_cfg.get('name', member_cfgs['model_cfg']['model'])
+        if name in members:
+            raise ValueError("Duplicated member name %s, please name the members differently." % name)
+        msg_mgr.log_info("Building member %s..." % name)
+        model = getattr(models, member_cfgs['model_cfg']['model'])(member_cfgs, False)
+        model.eval()
+        if not model.batched_inference and torch.distributed.get_world_size() != evaluator_cfg['sampler']['batch_size']:
+            raise ValueError("The batch size ({}) must be equal to the number of GPUs ({}) for member {}!".format(
+                evaluator_cfg['sampler']['batch_size'], torch.distributed.get_world_size(), name))
+        members[name] = model
+    return members
+
+
+def inference(members, inputs_idx, loader, rank):
+    """Inference all the test data with all the members, loading each batch only once.
+
+    Args:
+        members: the member models.
+        inputs_idx: the indices of the loaded data fed to each member.
+        loader: the shared test loader.
+        rank: the rank of the current process.
+    Returns:
+        Odict: contains the inference results of each member.
+    """
+    info_dicts = Odict({name: Odict() for name in members.keys()})
+    for inputs in BaseModel.iter_test_batches(loader, rank):
+        seqs_batch = inputs[0]
+        for name, model in members.items():
+            member_inputs = [[seqs_batch[i] for i in inputs_idx[name]]] + list(inputs[1:])
+            info_dicts[name].append(model.inference_batch(member_inputs))
+    for info_dict in info_dicts.values():
+        BaseModel.concat_inference(info_dict, len(loader))
+    return info_dicts
+
+
+def fuse_embeddings(embeddings, weights):
+    """Fuse the embeddings of the members into one.
+
+    Each embedding is flattened, L2 normalized and scaled by sqrt(w / sum(w)) before the
+     concatenation, so the cosine similarity of the fused embeddings equals the weighted average
+     of the cosine similarities of the members.
+
+    Args:
+        embeddings: list of the embeddings in [n, c, p].
+        weights: list of the weights of the members.
+    Returns:
+        np.ndarray: the fused embeddings in [n, c', 1].
+    """
+    weights = np.asarray(weights, dtype=np.float32)
+    weights = weights / weights.sum()
+    fused = []
+    for emb, w in zip(embeddings, weights):
+        emb = emb.reshape(emb.shape[0], -1).astype(np.float32)
+        emb = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-9)
+        fused.append(emb * np.sqrt(w))
+    return np.concatenate(fused, axis=1)[..., np.newaxis]
+
+
+def run_ensemble_test(cfgs):
+    """Build the members from the ensemble config, then run the shared test loop and evaluate each member and the fusion."""
+    msg_mgr = get_msg_mgr()
+    ensemble_cfg = cfgs['ensemble_cfg']
+    members = build_members(cfgs)
+    names = list(members.keys())
+    inputs_idx = {name: member_cfg['inputs']
+                  for name, member_cfg in zip(names, ensemble_cfg['members'])}
+    weights = [member_cfg.get('weight', 1.0)
+               for member_cfg in ensemble_cfg['members']]
+
+    # all the members got the same test loader from the cache in `BaseModel.get_loader`
+    first = members[names[0]]
+    loader = first.test_loader
+    rank = torch.distributed.get_rank()
+    with torch.no_grad():
+        info_dicts = inference(members, inputs_idx, loader, rank)
+    if rank != 0:
+        return
+
+    result_dicts = Odict()
+    for name in names:
+        msg_mgr.log_info("-------- Member: %s --------" % name)
+        result_dicts[name] = BaseModel.evaluate(members[name], Odict(info_dicts[name]))
+
+    msg_mgr.log_info("-------- Fusion: %s --------" % ' + '.join(names))
+    fused = fuse_embeddings(
+        [info_dicts[name]['embeddings'] for name in names], weights)
+    result_dicts['fusion'] = BaseModel.evaluate(first, Odict({'embeddings': fused}), cfgs['evaluator_cfg'])
+
+    if ensemble_cfg.get('save_embeddings', True):
+        save_path = osp.join('output/', cfgs['data_cfg']['dataset_name'],
+                             cfgs['model_cfg']['model'], cfgs['evaluator_cfg']['save_name'])
+        mkdir(save_path)
+        embeddings = {name: info_dicts[name]['embeddings'] for name in names}
+        embeddings['fusion'] = fused
+        np.savez(osp.join(save_path, 'embeddings.npz'),
+                 labels=np.asarray(loader.dataset.label_list),
+                 types=np.asarray(loader.dataset.types_list),
+                 views=np.asarray(loader.dataset.views_list),
+                 **embeddings)
+        msg_mgr.log_info("Embeddings saved in %s" %
+                         osp.join(save_path, 'embeddings.npz'))
+    return result_dicts
@@ -3,7 +3,8 @@
 import torch
 import torch.nn as nn
 from . import losses
-from utils import is_dict, get_attr_from, get_valid_args, is_tensor, get_ddp_module
+from torch.nn.parallel import DistributedDataParallel as DDP
+from utils import is_dict, get_attr_from, get_valid_args, is_tensor, get_ddp_module, get_device, ddp_all_gather_coalesced
 from utils import Odict
 from utils import get_msg_mgr
 
@@ -44,9 +45,46 @@ class LossAggregator(nn.Module):
         Loss = get_attr_from([losses], loss_cfg['type'])
         valid_loss_arg = get_valid_args(
             Loss, loss_cfg, ['type', 'gather_and_scale'])
-        loss = get_ddp_module(Loss(**valid_loss_arg).cuda())
+        loss = get_ddp_module(Loss(**valid_loss_arg).to(get_device()))
         return loss
 
+    def _to_float32(self, value):
+        if is_tensor(value) and value.is_floating_point():
+            return value.float()
+        return value
+
+    def _gathers_inputs(self, loss_func):
+        loss_func = loss_func.module if isinstance(loss_func, DDP) else loss_func
+        return getattr(type(loss_func).forward, 'gathers_inputs', False)
+
+    def _gather_inputs(self, training_feats):
+        """Gather the inputs of all the losses from all the cards in one collective.
+
+        Each tensor is gathered once, even if shared by several losses, e.g. the labels.
+
+        Returns:
+            dict: the inputs of each loss gathering its inputs, in float32.
+        """
+        inputs, unique = {}, {}
+        for k, v in training_feats.items():
+            if k in self.losses and self._gathers_inputs(self.losses[k]):
+                for value in v.values():
+                    if is_tensor(value) and id(value) not in unique:
+                        unique[id(value)] = self._to_float32(value)
+                inputs[k] = v
+        if len(unique) == 0:
+            return {}
+        gathered = dict(zip(unique.keys(), ddp_all_gather_coalesced(list(unique.values()))))
+        return {k: {name: gathered.get(id(value), value) for name, value in v.items()}
+                for k, v in inputs.items()}
+
+    def reset_memory(self):
+        """Clear the memories of the former micro-batches kept by the losses, e.g. of `TripletLoss`, when the optimizer steps."""
+        for loss_func in self.losses.values():
+            loss_func = loss_func.module if isinstance(loss_func, DDP) else loss_func
+            if hasattr(loss_func, 'ResetMemory'):
+                loss_func.ResetMemory()
+
     def forward(self, training_feats):
         """Compute the sum of all losses.
 
@@ -58,11 +96,17 @@ class LossAggregator(nn.Module):
         """
         loss_sum = .0
         loss_info = Odict()
+        gathered_feats = self._gather_inputs(training_feats)
 
         for k, v in training_feats.items():
             if k in self.losses:
                 loss_func = self.losses[k]
-                loss, info = loss_func(**v)
+                # the losses are always computed in float32, even under autocast
+                with torch.autocast(device_type=get_device().type, enabled=False):
+                    if k in gathered_feats:
+                        loss, info = loss_func(gathered=True, **gathered_feats[k])
+                    else:
+                        loss, info = loss_func(**{name: self._to_float32(value) for name, value in v.items()})
                 for name, value in info.items():
                     loss_info['scalar/%s/%s' % (k, name)] = value
                 loss = loss.mean() * loss_func.loss_term_weight
@@ -74,7 +118,7 @@ class LossAggregator(nn.Module):
                         "The key %s in -Trainng-Feat- should be stated in your loss_cfg as log_prefix."%k
                     )
                 elif is_tensor(v):
-                    _ = v.mean()
+                    _ = v.float().mean()
                     loss_info['scalar/%s' % k] = _
                     loss_sum += _
                     get_msg_mgr().log_debug(
@@ -8,20 +8,24 @@ from utils import ddp_all_gather
 
 def gather_and_scale_wrapper(func):
     """Internal wrapper: gather the input from multple cards to one card, and scale the loss by the number of cards.
+
+    `gathered=True` tells the input is gathered already, e.g. by `LossAggregator` for all the losses at once.
     """
 
     @functools.wraps(func)
-    def inner(*args, **kwds):
+    def inner(*args, gathered=False, **kwds):
         try:
 
-            for k, v in kwds.items():
-                kwds[k] = ddp_all_gather(v)
+            if not gathered:
+                for k, v in kwds.items():
+                    kwds[k] = ddp_all_gather(v)
 
             loss, loss_info = func(*args, **kwds)
             loss *= torch.distributed.get_world_size()
             return loss, loss_info
         except:
             raise ArgumentError
+    inner.gathers_inputs = True
     return inner
 
 
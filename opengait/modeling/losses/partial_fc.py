@@ -0,0 +1,181 @@
+import math
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .base import BaseLoss
+from utils import ddp_all_gather
+
+
+class GatherWithGrad(torch.autograd.Function):
+    """Gather the features of all the ranks along dim 0, with the gradients of all the ranks summed back.
+
+    The gradient is scaled by the number of cards, as `gather_and_scale_wrapper` does, since DDP averages it.
+    """
+    @staticmethod
+    def forward(ctx, features):
+        world_size = torch.distributed.get_world_size()
+        ctx.rank, ctx.batch_size, ctx.world_size = torch.distributed.get_rank(), features.size(0), world_size
+        feature_list = [torch.empty_like(features) for _ in range(world_size)]
+        torch.distributed.all_gather(feature_list, features.contiguous())
+        return torch.cat(feature_list, 0)
+
+    @staticmethod
+    def backward(ctx, grad):
+        grad = grad.clone(memory_format=torch.contiguous_format)
+        torch.distributed.all_reduce(grad)
+        start = ctx.rank * ctx.batch_size
+        return grad[start:start + ctx.batch_size] * ctx.world_size
+
+
+class DistSoftmaxCrossEntropy(torch.autograd.Function):
+    """The label-smoothed softmax cross entropy over the classes sharded across the ranks.
+
+    Only the max, the sum of the exponentials and the target probability of each sample are all-reduced,
+     the [n, classes] logits are never gathered.
+    """
+    @staticmethod
+    def forward(ctx, logits, labels, eps):
+        """
+            logits: [p, n, k], the logits of the local classes
+            labels: [n], the local indices of the targets, -1 for the ones of the other ranks
+        """
+        max_logits = logits.max(-1, keepdim=True)[0]
+        torch.distributed.all_reduce(max_logits, torch.distributed.ReduceOp.MAX)
+        exp_logits = (logits - max_logits).exp()
+        sum_exp = exp_logits.sum(-1, keepdim=True)
+        torch.distributed.all_reduce(sum_exp)
+        prob = exp_logits / sum_exp  # [p, n, k]
+
+        local = labels >= 0
+        target_prob = torch.zeros_like(prob[..., 0])  # [p, n]
+        target_prob[:, local] = prob[:, local, labels[local]]
+        torch.distributed.all_reduce(target_prob)
+        loss = -(1 - eps) * target_prob.clamp_min(1e-30).log()
+        if eps > 0:
+            # the average of the log-probabilities over all the classes
+            class_num = torch.tensor(float(logits.size(-1)), device=logits.device)
+            torch.distributed.all_reduce(class_num)
+            sum_logits = logits.sum(-1)
+            torch.distributed.all_reduce(sum_logits)
+            log_prob_sum = sum_logits - class_num * (max_logits + sum_exp.log()).squeeze(-1)
+            loss = loss - eps * log_prob_sum / class_num
+        else:
+            class_num = None
+
+        ctx.save_for_backward(prob, labels)
+        ctx.eps, ctx.class_num = eps, class_num
+        return loss.mean()
+
+    @staticmethod
+    def backward(ctx, grad):
+        prob, labels = ctx.saved_tensors
+        p, n, _ = prob.size()
+        grad_logits = prob.clone()
+        local = labels >= 0
+        grad_logits[:, local, labels[local]] -= 1 - ctx.eps
+        if ctx.eps > 0:
+            grad_logits -= ctx.eps / ctx.class_num
+        return grad_logits * grad / (p * n), None, None
+
+
+class PartialFCLoss(BaseLoss):
+    """
+        Partial FC: Training 10 Million Identities on a Single Machine
+        ICCV Workshop: https://arxiv.org/abs/2010.05222
+        Github: https://github.com/deepinsight/insightface/tree/master/recognition/arcface_torch
+
+        The cross entropy of `SeparateBNNecks` with the class centres sharded across the ranks, for the huge numbers of identities.
+        Each rank keeps the centres of a slice of the classes, and classifies the features gathered from all the ranks
+            by the centres of the classes in the batch and `sample_rate` of the others.
+        Feed it the features of `SeparateBNNecks` with `partial_fc: true`.
+
+        The loss is the mean over the batch of all the ranks, and each rank gets the gradients of its centres from
+            all the samples, so they equal the ones of the dense head averaged by DDP: the learning rates transfer.
+            The gradients of the features are scaled by the number of ranks, which is cancelled by the averaging of DDP.
+    """
+
+    def __init__(self, class_num, parts_num, in_channels, sample_rate=1.0, scale=2**4, label_smooth=True, eps=0.1,
+                 loss_term_weight=1.0, log_accuracy=False):
+        super(PartialFCLoss, self).__init__(loss_term_weight)
+        world_size = torch.distributed.get_world_size()
+        rank = torch.distributed.get_rank()
+        self.class_num = class_num
+        self.shard_size = math.ceil(class_num / world_size)
+        self.class_start = min(class_num, rank * self.shard_size)
+        self.local_num = min(class_num, self.class_start + self.shard_size) - self.class_start
+        if self.local_num <= 0:
+            raise ValueError("The class_num ({}) is too small to be sharded across {} ranks.".format(class_num, world_size))
+        self.sample_rate = sample_rate
+        self.scale = scale
+        self.eps = eps if label_smooth else 0.
+        self.log_accuracy = log_accuracy
+
+        # the same scale as the xavier_uniform_ of the full [p, c, class_num] one of SeparateBNNecks
+        bound = math.sqrt(6.0 / ((parts_num + in_channels) * class_num))
+        self.fc_bin = nn.Parameter(
+            nn.init.uniform_(torch.zeros(parts_num, in_channels, self.shard_size), -bound, bound))
+        # kept by each rank, not synchronized by DDP
+        self.fc_bin.sharded = True
+        self._register_load_state_dict_pre_hook(self._shard_state_dict)
+
+    def gather_state_dict(self, state_dict, prefix=''):
+        """Replace the local centres in the state dict by the ones of all the classes, in [p, c, class_num] as
+         `SeparateBNNecks`, to be loaded by any number of ranks.
+
+        A collective called by all the ranks, e.g. by `BaseModel.save_ckpt`, not a hook of `state_dict`, which may
+         be called by one rank only.
+        """
+        shards = [torch.empty_like(self.fc_bin) for _ in range(torch.distributed.get_world_size())]
+        torch.distributed.all_gather(shards, self.fc_bin.detach().contiguous())
+        state_dict[prefix + 'fc_bin'] = torch.cat(shards, -1)[..., :self.class_num]
+        return state_dict
+
+    def _shard_state_dict(self, state_dict, prefix, *args):
+        key = prefix + 'fc_bin'
+        if key in state_dict and state_dict[key].size(-1) == self.class_num:
+            fc_bin = state_dict[key][..., self.class_start:self.class_start + self.shard_size]
+            state_dict[key] = F.pad(fc_bin, (0, self.shard_size - fc_bin.size(-1)))
+
+    def sample_centres(self, labels):
+        """Sample the local centres, all the ones of the classes in the batch and `sample_rate` of the others.
+
+        Returns:
+            the indices or the slice of the sampled centres, and the labels as the indices among them, -1 for the other ranks.
+        """
+        local_labels = labels - self.class_start
+        local = (local_labels >= 0) & (local_labels < self.local_num)
+        if self.sample_rate >= 1:
+            return slice(0, self.local_num), torch.where(local, local_labels, -1)
+        score = torch.rand(self.local_num, device=labels.device)
+        score[local_labels[local]] = 2.  # the positive ones first
+        sample_num = max(int(self.sample_rate * self.local_num), int((score > 1).sum()))
+        index = score.topk(sample_num)[1].sort()[0]
+        mapping = torch.full((self.local_num,), -1, dtype=torch.long, device=labels.device)
+        mapping[index] = torch.arange(sample_num, device=labels.device)
+        return index, torch.where(local, mapping[local_labels.clamp(0, self.local_num - 1)], -1)
+
+    def forward(self, logits, labels):
+        """
+            logits: [n, c, p], the features of `SeparateBNNecks` with `partial_fc: true`
+            labels: [n]
+        """
+        features = GatherWithGrad.apply(logits.float())  # [n', c, p]
+        labels = ddp_all_gather(labels, requires_grad=False)  # [n']
+        features = F.normalize(features.permute(2, 0, 1), dim=-1)  # [p, n', c]
+
+        index, local_labels = self.sample_centres(labels)
+        centres = F.normalize(self.fc_bin[..., index], dim=1)  # [p, c, k]
+        local_logits = features.matmul(centres) * self.scale  # [p, n', k]
+        loss = DistSoftmaxCrossEntropy.apply(local_logits, local_labels, self.eps)
+        self.info.update({'loss': loss.detach().clone()})
+        if self.log_accuracy:
+            with torch.no_grad():
+                max_logits = local_logits.max(-1)[0]
+                torch.distributed.all_reduce(max_logits, torch.distributed.ReduceOp.MAX)
+                target_logits = torch.zeros_like(max_logits)
+                local = local_labels >= 0
+                target_logits[:, local] = local_logits[:, local, local_labels[local]]
+                torch.distributed.all_reduce(target_logits)
+                self.info.update({'accuracy': (target_logits >= max_logits).float().mean()})
+        return loss, self.info
@@ -8,9 +8,9 @@ from .base import BaseLoss, gather_and_scale_wrapper
 
 
 class SupConLoss_Re(BaseLoss):
-    def __init__(self, temperature=0.01):
+    def __init__(self, temperature=0.01, chunk_size=0):
         super(SupConLoss_Re, self).__init__()
-        self.train_loss = SupConLoss(temperature=temperature)
+        self.train_loss = SupConLoss(temperature=temperature, chunk_size=chunk_size)
 
     @gather_and_scale_wrapper
     def forward(self, features, labels=None, mask=None):
@@ -21,10 +21,10 @@ class SupConLoss_Re(BaseLoss):
 
 
 class SupConLoss_Lp(BaseLoss):
-    def __init__(self, temperature=0.01):
+    def __init__(self, temperature=0.01, chunk_size=0):
         super(SupConLoss_Lp, self).__init__()
         self.train_loss = SupConLoss(
-            temperature=temperature, base_temperature=temperature, reduce_zero=True, p=2)
+            temperature=temperature, base_temperature=temperature, reduce_zero=True, p=2, chunk_size=chunk_size)
 
     @gather_and_scale_wrapper
     def forward(self, features, labels=None, mask=None):
@@ -39,13 +39,17 @@ class SupConLoss(nn.Module):
     It also supports the unsupervised contrastive loss in SimCLR"""
 
     def __init__(self, temperature=0.01, contrast_mode='all',
-                 base_temperature=0.07, reduce_zero=False, p=None):
+                 base_temperature=0.07, reduce_zero=False, p=None, chunk_size=0):
+        """
+            chunk_size: the size of the tiles of the similarity matrix computed at a time, 0 for the whole matrix at once.
+        """
         super(SupConLoss, self).__init__()
         self.temperature = temperature
         self.contrast_mode = contrast_mode
         self.base_temperature = base_temperature
         self.reduce_zero = reduce_zero
         self.p = p
+        self.chunk_size = chunk_size
 
     def forward(self, features, labels=None, mask=None):
         """Compute loss for model. If both `labels` and `mask` are None,
@@ -73,12 +77,12 @@ class SupConLoss(nn.Module):
         if labels is not None and mask is not None:
             raise ValueError('Cannot define both `labels` and `mask`')
         elif labels is None and mask is None:
-            mask = torch.eye(batch_size, dtype=torch.float32).to(device)
-        elif labels is not None:
-            labels = labels.contiguous().view(-1, 1)
+            # each sample is the only positive of its own views
+            labels = torch.arange(batch_size, device=device)
+        if labels is not None:
+            labels = labels.contiguous().view(-1, 1).to(device)
             if labels.shape[0] != batch_size:
                 raise ValueError('Num of labels does not match num of features')
-            mask = torch.eq(labels, labels.T).float().to(device)
         else:
             mask = mask.float().to(device)
 
@@ -93,6 +97,18 @@ class SupConLoss(nn.Module):
         else:
             raise ValueError('Unknown mode: {}'.format(self.contrast_mode))
 
+        if self.chunk_size > 0:
+            if self.p is not None:
+                anchor_feature = torch.nn.functional.normalize(
+                    anchor_feature, p=self.p, dim=1)
+                contrast_feature = torch.nn.functional.normalize(
+                    contrast_feature, p=self.p, dim=1)
+            # the positives of each tile are got from the labels, not from a [bsz, bsz] mask
+            return TiledSupCon.apply(anchor_feature, contrast_feature, labels, mask, self)
+
+        if mask is None:
+            mask = torch.eq(labels, labels.T).float()
+
         # compute distance mat
         if self.p is None:
             mat = torch.matmul(
@@ -133,3 +149,91 @@ class SupConLoss(nn.Module):
             loss = loss[loss > 0]
 
         return loss.mean()
+
+
+class TiledSupCon(torch.autograd.Function):
+    """The same loss and gradients as `SupConLoss`, with the [n_a, n_c] similarity matrix computed tile by tile.
+
+    The log-sum-exp of each anchor is accumulated online over the tiles of the contrasts, and only it and the
+     counts of the positives are kept for the backward, where the tiles are computed again, so the memory
+     is of one [chunk_size, chunk_size] tile instead of the whole matrix. The positives of each tile are
+     compared from the labels, or taken from the explicit `mask` if given, the only [bsz, bsz] tensor then.
+    """
+    @staticmethod
+    def similarity(anchor, contrast, loss):
+        if loss.p is None:
+            mat = torch.matmul(anchor, contrast.T)
+        else:
+            mat = -torch.cdist(anchor, contrast, p=loss.p)
+        return mat / loss.temperature
+
+    @staticmethod
+    def tiles(anchor_num, contrast_num, labels, mask, chunk_size, device):
+        """Yield the rows and columns of each tile, with the (weighted) mask of the positives and the one of the anchors themselves."""
+        bsz = labels.size(0) if labels is not None else mask.size(0)
+        for row_start in range(0, anchor_num, chunk_size):
+            rows = torch.arange(row_start, min(row_start + chunk_size, anchor_num), device=device)
+            for col_start in range(0, contrast_num, chunk_size):
+                cols = torch.arange(col_start, min(col_start + chunk_size, contrast_num), device=device)
+                self_mask = rows.unsqueeze(1) == cols.unsqueeze(0)
+                if labels is not None:
+                    pos_mask = (labels[rows % bsz] == labels[cols % bsz].T).float()
+                else:
+                    pos_mask = mask[rows % bsz][:, cols % bsz]
+                pos_mask = pos_mask * torch.logical_not(self_mask)
+                yield rows, cols, pos_mask, self_mask
+
+    @staticmethod
+    def forward(ctx, anchor, contrast, labels, mask, loss):
+        anchor_num, contrast_num = anchor.size(0), contrast.size(0)
+        lse = torch.full((anchor_num,), float('-inf'), device=anchor.device)
+        sum_exp = torch.zeros(anchor_num, device=anchor.device)
+        pos_sum = torch.zeros(anchor_num, device=anchor.device)
+        pos_num = torch.zeros(anchor_num, device=anchor.device)
+        for rows, cols, pos_mask, self_mask in TiledSupCon.tiles(
+                anchor_num, contrast_num, labels, mask, loss.chunk_size, anchor.device):
+            mat = TiledSupCon.similarity(anchor[rows], contrast[cols], loss).float()
+            pos_sum[rows] += (mat * pos_mask).sum(1)
+            pos_num[rows] += pos_mask.sum(1)
+            # online log-sum-exp, excluding the anchor itself
+            mat = mat.masked_fill(self_mask, float('-inf'))
+            new_max = torch.maximum(lse[rows], mat.max(1)[0])
+            safe_max = torch.where(torch.isinf(new_max), torch.zeros_like(new_max), new_max)
+            sum_exp[rows] = sum_exp[rows] * torch.exp(lse[rows] - safe_max) + \
+                torch.exp(mat - safe_max.unsqueeze(1)).sum(1)
+            lse[rows] = new_max
+        lse = lse + torch.log(sum_exp)
+
+        tiny = torch.finfo(torch.float32).tiny
+        scale = -(loss.temperature / loss.base_temperature)
+        rows_loss = scale * (pos_sum - pos_num * lse) / (pos_num + tiny)
+        if loss.reduce_zero:
+            weight = (rows_loss > 0).float()
+        else:
+            weight = torch.ones_like(rows_loss)
+        weight = weight / weight.sum()
+        ctx.save_for_backward(anchor, contrast, labels, mask, lse, pos_num, weight)
+        ctx.loss = loss
+        # the mean over the kept anchors, NaN if none is kept as `SupConLoss`
+        return (rows_loss * weight).sum()
+
+    @staticmethod
+    def backward(ctx, grad):
+        anchor, contrast, labels, mask, lse, pos_num, weight = ctx.saved_tensors
+        loss = ctx.loss
+        tiny = torch.finfo(torch.float32).tiny
+        coef = grad * weight * -(loss.temperature / loss.base_temperature) / (pos_num + tiny)  # [n_a]
+        grad_anchor = torch.zeros_like(anchor)
+        grad_contrast = torch.zeros_like(contrast)
+        for rows, cols, pos_mask, self_mask in TiledSupCon.tiles(
+                anchor.size(0), contrast.size(0), labels, mask, loss.chunk_size, anchor.device):
+            with torch.enable_grad():
+                anchor_tile = anchor[rows].detach().requires_grad_()
+                contrast_tile = contrast[cols].detach().requires_grad_()
+                mat = TiledSupCon.similarity(anchor_tile, contrast_tile, loss).float()
+            prob = torch.exp(mat.detach() - lse[rows].unsqueeze(1)).masked_fill(self_mask, 0)
+            grad_mat = coef[rows].unsqueeze(1) * (pos_mask - pos_num[rows].unsqueeze(1) * prob)
+            grad_anchor_tile, grad_contrast_tile = torch.autograd.grad(mat, (anchor_tile, contrast_tile), grad_mat)
+            grad_anchor[rows] += grad_anchor_tile
+            grad_contrast[cols] += grad_contrast_tile
+        return grad_anchor, grad_contrast, None, None, None
@@ -1,13 +1,32 @@
 import torch
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 
 from .base import BaseLoss, gather_and_scale_wrapper
 
 
 class TripletLoss(BaseLoss):
-    def __init__(self, margin, loss_term_weight=1.0):
+    def __init__(self, margin, loss_term_weight=1.0, memory_size=0, mining='all', chunk_size=0):
+        """
+            memory_size: the number of the embeddings of the former micro-batches of the accumulated batch kept as
+                the extra positives and negatives, e.g. (accumulation_steps - 1) * the total batch size of all GPUs,
+                0 for no memory. The memory is cleared when the optimizer steps.
+            mining: 'all' for all the valid triplets, 'hard' for the hardest positive and negative of each anchor.
+            chunk_size: the number of anchors whose triplets are formed at a time, 0 for all at once. Only for 'all',
+                and required with the memory, the [p, n, n + memory_size, n + memory_size] triplets of which are masked.
+        """
         super(TripletLoss, self).__init__(loss_term_weight)
+        if mining not in ['all', 'hard']:
+            raise ValueError("Unknown mining %s, choose 'all' or 'hard'." % mining)
+        if memory_size > 0 and mining == 'all' and chunk_size <= 0:
+            raise ValueError("The chunk_size of TripletLoss is required with the memory_size for the mining 'all', "
+                             "the masked triplets of all the anchors at once cost p * n * (n + memory_size)^2 floats.")
         self.margin = margin
+        self.memory_size = memory_size
+        self.mining = mining
+        self.chunk_size = chunk_size
+        self.memory_embed = None
+        self.memory_label = None
 
     @gather_and_scale_wrapper
     def forward(self, embeddings, labels):
@@ -16,14 +35,24 @@ class TripletLoss(BaseLoss):
             2, 0, 1).contiguous().float()  # [n, c, p] -> [p, n, c]
 
         ref_embed, ref_label = embeddings, labels
+        if self.memory_embed is not None:
+            ref_embed = torch.cat([embeddings, self.memory_embed], 1)
+            ref_label = torch.cat([labels, self.memory_label])
         dist = self.ComputeDistance(embeddings, ref_embed)  # [p, n1, n2]
         mean_dist = dist.mean((1, 2))  # [p]
-        ap_dist, an_dist = self.Convert2Triplets(labels, ref_label, dist)
-        dist_diff = (ap_dist - an_dist).view(dist.size(0), -1)
-        loss = F.relu(dist_diff + self.margin)
-
-        hard_loss = torch.max(loss, -1)[0]
-        loss_avg, loss_num = self.AvgNonZeroReducer(loss)
+        masked = self.memory_embed is not None
+        if self.mining == 'hard':
+            loss = self.HardTriplets(labels, ref_label, dist)
+            hard_loss = torch.max(loss, -1)[0]
+            loss_avg, loss_num = self.AvgNonZeroReducer(loss)
+        elif self.chunk_size > 0:
+            loss_avg, loss_num, hard_loss = self.ChunkedReducer(labels, ref_label, dist, masked)
+        else:
+            loss = self.AllTriplets(labels, ref_label, dist, masked)
+            hard_loss = torch.max(loss, -1)[0]
+            loss_avg, loss_num = self.AvgNonZeroReducer(loss)
+        if self.memory_size > 0:
+            self.UpdateMemory(embeddings, labels)
 
         self.info.update({
             'loss': loss_avg.detach().clone(),
@@ -39,9 +68,56 @@ class TripletLoss(BaseLoss):
         loss_num = (loss != 0).sum(-1).float()
 
         loss_avg = loss_sum / (loss_num + eps)
-        loss_avg[loss_num == 0] = 0
+        loss_avg = loss_avg.masked_fill(loss_num == 0, 0)
         return loss_avg, loss_num
 
+    def ChunkedReducer(self, row_labels, clo_label, dist, masked):
+        """
+            The same as AllTriplets followed by AvgNonZeroReducer, but with `chunk_size` anchors at a time.
+            The triplets of each chunk are reduced at once and recomputed in the backward,
+                so the [p, n, k, n-k] triplets are never kept as a whole.
+        """
+        eps = 1.0e-9
+        loss_sum, loss_num, hard_loss = 0, 0, []
+        for start in range(0, dist.size(1), self.chunk_size):
+            end = start + self.chunk_size
+            chunk_sum, chunk_num, chunk_hard = checkpoint(
+                self.ReduceTriplets, row_labels[start:end], clo_label, dist[:, start:end], masked, use_reentrant=False)
+            loss_sum = loss_sum + chunk_sum
+            loss_num = loss_num + chunk_num
+            hard_loss.append(chunk_hard)
+        hard_loss = torch.stack(hard_loss, -1).max(-1)[0]
+
+        loss_avg = loss_sum / (loss_num + eps)
+        loss_avg = loss_avg.masked_fill(loss_num == 0, 0)
+        return loss_avg, loss_num, hard_loss
+
+    def ReduceTriplets(self, row_labels, clo_label, dist, masked):
+        loss = self.AllTriplets(row_labels, clo_label, dist, masked)
+        return loss.sum(-1), (loss != 0).sum(-1).float(), torch.max(loss, -1)[0]
+
+    def AllTriplets(self, row_labels, clo_label, dist, masked):
+        """
+            The batch-all triplets, `masked` for the variable number of positives per anchor with the memory.
+            Out: loss with size [p, n_r * k * (n_c - k)], or [p, n_r * n_c * n_c] if masked.
+        """
+        if masked:
+            return self.MaskedTriplets(row_labels, clo_label, dist)
+        ap_dist, an_dist = self.Convert2Triplets(row_labels, clo_label, dist)
+        dist_diff = (ap_dist - an_dist).view(dist.size(0), -1)
+        return F.relu(dist_diff + self.margin)
+
+    def HardTriplets(self, row_labels, clo_label, dist):
+        """
+            The batch-hard triplets, of the farthest positive and the nearest negative of each anchor in rows.
+            Out: loss with size [p, n_r]
+        """
+        matches = (row_labels.unsqueeze(1) ==
+                   clo_label.unsqueeze(0)).bool()  # [n_r, n_c]
+        hard_ap_dist = dist.masked_fill(torch.logical_not(matches), float('-inf')).max(-1)[0]  # [p, n_r]
+        hard_an_dist = dist.masked_fill(matches, float('inf')).min(-1)[0]  # [p, n_r]
+        return F.relu(hard_ap_dist - hard_an_dist + self.margin)
+
     def ComputeDistance(self, x, y):
         """
             x: [p, n_x, c]
@@ -54,6 +130,33 @@ class TripletLoss(BaseLoss):
         dist = torch.sqrt(F.relu(dist))  # [p, n_x, n_y]
         return dist
 
+    def MaskedTriplets(self, row_labels, clo_label, dist):
+        """
+            The triplet losses of all the anchors in rows, for the variable number of positives per anchor.
+            Out: loss with size [p, n_r * n_c * n_c], zeros for the invalid triplets.
+        """
+        matches = (row_labels.unsqueeze(1) ==
+                   clo_label.unsqueeze(0)).bool()  # [n_r, n_c]
+        valid = matches.unsqueeze(2) & torch.logical_not(matches).unsqueeze(1)  # [n_r, n_c(ap), n_c(an)]
+        p = dist.size(0)
+        loss = F.relu(dist.unsqueeze(3) - dist.unsqueeze(2) + self.margin)  # [p, n_r, n_c, n_c]
+        loss = loss.masked_fill(torch.logical_not(valid).unsqueeze(0), 0)
+        return loss.view(p, -1)
+
+    def UpdateMemory(self, embeddings, labels):
+        """Keep the latest `memory_size` embeddings, detached."""
+        embeddings, labels = embeddings.detach(), labels.detach()
+        if self.memory_embed is not None:
+            embeddings = torch.cat([embeddings, self.memory_embed], 1)
+            labels = torch.cat([labels, self.memory_label])
+        self.memory_embed = embeddings[:, :self.memory_size]
+        self.memory_label = labels[:self.memory_size]
+
+    def ResetMemory(self):
+        """Forget the embeddings of the former micro-batches, when the optimizer steps."""
+        self.memory_embed = None
+        self.memory_label = None
+
     def Convert2Triplets(self, row_labels, clo_label, dist):
         """
             row_labels: tensor with size [n_r]
@@ -108,6 +108,8 @@ class BigGait__Dinov2_Gaitbase(BaseModel):
 
     def init_DINOv2(self):
         self.backbone = vit_small(logger = self.msg_mgr)
+        if self.skip_init:
+            return
         self.msg_mgr.log_info(f'load model from: {self.pretrained_dinov2}')
         pretrain_dict = torch.load(self.pretrained_dinov2)
         msg = self.backbone.load_state_dict(pretrain_dict, strict=True)
@@ -128,19 +130,8 @@ class BigGait__Dinov2_Gaitbase(BaseModel):
         self.msg_mgr.log_info('SegmentationBranch Count: {:.5f}M'.format(n_parameters / 1e6))
 
     def init_parameters(self):
-        for m in self.modules():
-            if isinstance(m, (nn.Conv3d, nn.Conv2d, nn.Conv1d)):
-                nn.init.xavier_uniform_(m.weight.data)
-                if m.bias is not None:
-                    nn.init.constant_(m.bias.data, 0.0)
-            elif isinstance(m, nn.Linear):
-                nn.init.xavier_uniform_(m.weight.data)
-                if m.bias is not None:
-                    nn.init.constant_(m.bias.data, 0.0)
-            elif isinstance(m, (nn.BatchNorm3d, nn.BatchNorm2d, nn.BatchNorm1d)):
-                if m.affine:
-                    nn.init.normal_(m.weight.data, 1.0, 0.02)
-                    nn.init.constant_(m.bias.data, 0.0)
+        # skipped when restoring strictly, the DINOv2 backbone is still built below with its weights from the checkpoint
+        super().init_parameters()
 
         n_parameters = sum(p.numel() for p in self.parameters())
         self.msg_mgr.log_info('Expect backbone Count: {:.5f}M'.format(n_parameters / 1e6))
@@ -263,8 +254,8 @@ class BigGait__Dinov2_Gaitbase(BaseModel):
         appearance = appearance.view(n*s,-1,self.app_dim)
         del app_feat
 
-        # vis
-        if self.training:
+        # vis, only on the logging iterations
+        if self.training and self.should_log_visuals:
             try:
                 vis_num = min(5, n*s)
                 vis_mask = foreground.view(n*s, self.sils_size*2*self.sils_size, -1)[:vis_num].detach().cpu().numpy()
@@ -300,16 +291,18 @@ class BigGait__Dinov2_Gaitbase(BaseModel):
                     'triplet': {'embeddings': embed_1, 'labels': labs},
                     'softmax': {'logits': logits, 'labels': labs},
                 },
-                'visual_summary': {
+                'visual_summary': {},
+                'inference_feat': {
+                    'embeddings': embed_1
+                }
+            }
+            if self.should_log_visuals:
+                retval['visual_summary'] = {
                     'image/input': sils.view(n*s, c, h, w),
                     'image/foreground': self.min_max_norm(rearrange(foreground.view(n, s, self.sils_size*2, self.sils_size, -1), 'n s h w c -> (n s) c h w').contiguous()),
                     'image/denosing':self.min_max_norm(rearrange(torch.from_numpy(vis_denosing).float(), 'n s c h w -> (n s) c h w').contiguous()),
                     'image/appearance': self.min_max_norm(rearrange(torch.from_numpy(vis_appearance).float(), 'n s c h w -> (n s) c h w').contiguous()),
-                },
-                'inference_feat': {
-                    'embeddings': embed_1
                 }
-            }
         else:
             retval = {
                 'training_feat': {},
@@ -62,7 +62,7 @@ class DeepGaitV2(BaseModel):
             self.layer4 = SetBlockWrapper(self.layer4)
 
         self.FCs = SeparateFCs(16, channels[3], channels[2])
-        self.BNNecks = SeparateBNNecks(16, channels[2], class_num=model_cfg['SeparateBNNecks']['class_num'])
+        self.BNNecks = SeparateBNNecks(16, channels[2], class_num=model_cfg['SeparateBNNecks']['class_num'], partial_fc=model_cfg['SeparateBNNecks'].get('partial_fc', False))
 
         self.TP = PackSequenceWrapper(torch.max)
         self.HPP = HorizontalPoolingPyramid(bin_num=[16])
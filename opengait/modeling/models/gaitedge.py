@@ -132,7 +132,8 @@ class GaitEdge(GaitGL):
         retval = super(GaitEdge, self).forward(
             [[cropped_logits], labs, None, None, seqL])
         retval['training_feat']['bce'] = {'logits': logits, 'labels': sils}
-        retval['visual_summary']['image/roi'] = cropped_logits.view(
-            n*s, 1, H, W)
+        if self.training and self.should_log_visuals:
+            retval['visual_summary']['image/roi'] = cropped_logits.view(
+                n*s, 1, H, W)
 
         return retval
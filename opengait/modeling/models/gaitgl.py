@@ -67,6 +67,8 @@ class GaitGL(BaseModel):
         Arxiv : https://arxiv.org/pdf/2011.01461.pdf
     """
 
+    batched_inference = True
+
     def __init__(self, *args, **kargs):
         super(GaitGL, self).__init__(*args, **kargs)
 
@@ -148,29 +150,77 @@ class GaitGL(BaseModel):
             self.Head1 = SeparateFCs(64, in_c[-1], class_num)
             self.Bn_head = True
 
+    def pad_sequences(self, sils, seqL):
+        """Split the concatenated testing sequences and pad them to the same length.
+
+        The 3D convolutions would mix the frames across the sequence boundaries if the sequences
+        were kept concatenated, so they are stacked along the batch dimension instead.
+
+        Args:
+            sils: [1, 1, sum(seqL), h, w]
+            seqL: [1, n]
+        Returns:
+            tuple: the padded sils [n, 1, s, h, w] and the length of each sequence [n].
+        """
+        seqs = []
+        for seq in sils[0, 0].split(seqL[0].tolist(), 0):
+            if seq.size(0) < 3:
+                repeat = 3 if seq.size(0) == 1 else 2
+                seq = seq.repeat(repeat, 1, 1)
+            seqs.append(seq)
+        lengths = torch.as_tensor([seq.size(0) for seq in seqs], device=sils.device)
+        sils = nn.utils.rnn.pad_sequence(seqs, batch_first=True).unsqueeze(1)
+        return sils, lengths
+
+    def get_mask(self, lengths, s):
+        """mask: [n, 1, s, 1, 1], True for the valid frames and False for the padded ones."""
+        mask = torch.arange(s, device=lengths.device).unsqueeze(0) < lengths.unsqueeze(1)
+        return mask.view(-1, 1, s, 1, 1)
+
+    def masked_forward(self, layers, x, mask):
+        """Run the 3D layers one by one, and zero the padded frames after each of them.
+
+        The padded frames are kept as zeros, which equals the zero padding of the temporal convolution at the sequence end.
+        """
+        if mask is None:
+            return layers(x)
+        for layer in layers if isinstance(layers, nn.Sequential) else [layers]:
+            x = layer(x) * mask
+        return x
+
     def forward(self, inputs):
         ipts, labs, _, _, seqL = inputs
-        seqL = None if not self.training else seqL
-        if not self.training and len(labs) != 1:
-            raise ValueError(
-                'The input size of each GPU must be 1 in testing mode, but got {}!'.format(len(labs)))
         sils = ipts[0].unsqueeze(1)
         del ipts
-        n, _, s, h, w = sils.size()
-        if s < 3:
-            repeat = 3 if s == 1 else 2
-            sils = sils.repeat(1, 1, repeat, 1, 1)
+        if self.training or seqL is None:
+            # the training keeps the sequences of the unfixed sampling concatenated, no padded frame in the BN statistics
+            n, _, s, h, w = sils.size()
+            if s < 3:
+                repeat = 3 if s == 1 else 2
+                sils = sils.repeat(1, 1, repeat, 1, 1)
+            lengths, mask = None, None
+        else:
+            sils, lengths = self.pad_sequences(sils, seqL)
+            mask = self.get_mask(lengths, sils.size(2))
 
-        outs = self.conv3d(sils)
+        outs = self.masked_forward(self.conv3d, sils, mask)
         outs = self.LTA(outs)
+        if lengths is not None:
+            # the temporal kernel and stride of LTA are both 3
+            mask = self.get_mask(lengths // 3, outs.size(2))
+            outs = outs * mask
 
-        outs = self.GLConvA0(outs)
+        outs = self.masked_forward(self.GLConvA0, outs, mask)
         outs = self.MaxPool0(outs)
 
-        outs = self.GLConvA1(outs)
-        outs = self.GLConvB2(outs)  # [n, c, s, h, w]
+        outs = self.masked_forward(self.GLConvA1, outs, mask)
+        outs = self.masked_forward(self.GLConvB2, outs, mask)  # [n, c, s, h, w]
 
-        outs = self.TP(outs, seqL=seqL, options={"dim": 2})[0]  # [n, c, h, w]
+        if mask is None:
+            outs = self.TP(outs, seqL=seqL if self.training else None, options={"dim": 2})[0]  # [n, c, h, w]
+        else:
+            # masked temporal max pooling
+            outs = outs.masked_fill(~mask, float('-inf')).max(2)[0]  # [n, c, h, w]
         outs = self.HPP(outs)  # [n, c, p]
 
         gait = self.Head0(outs)  # [n, c, p]
@@ -57,7 +57,7 @@ class GaitSSB_Pretrain(BaseModel):
                 labs = None
 
             if seqL_batch is not None:
-                seqL_batch = np2var(seqL_batch).int()
+                seqL_batch = torch.from_numpy(seqL_batch).int()
             seqL = seqL_batch
 
             ipts = seqs
@@ -58,7 +58,7 @@ class MultiGaitpp(BaseModel):
 
 
         self.FCs = SeparateFCs(16, 256*C, 128*C)
-        self.BNNecks = SeparateBNNecks(16, 128*C, class_num=model_cfg['SeparateBNNecks']['class_num'])
+        self.BNNecks = SeparateBNNecks(16, 128*C, class_num=model_cfg['SeparateBNNecks']['class_num'], partial_fc=model_cfg['SeparateBNNecks'].get('partial_fc', False))
  
         self.TP = PackSequenceWrapper(torch.max)
         self.HPP = HorizontalPoolingPyramid(bin_num=[16])
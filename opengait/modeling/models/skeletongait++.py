@@ -38,7 +38,7 @@ class SkeletonGaitPP(BaseModel):
        self.layer4 = self.make_layer(BasicBlockP3D, 256 * C, stride=[1, 1], blocks_num=B[3], mode='p3d')
 
        self.FCs = SeparateFCs(16, 256*C, 128*C)
-       self.BNNecks = SeparateBNNecks(16, 128*C, class_num=model_cfg['SeparateBNNecks']['class_num'])
+       self.BNNecks = SeparateBNNecks(16, 128*C, class_num=model_cfg['SeparateBNNecks']['class_num'], partial_fc=model_cfg['SeparateBNNecks'].get('partial_fc', False))
 
        self.TP = PackSequenceWrapper(torch.max)
        self.HPP = HorizontalPoolingPyramid(bin_num=[16])
@@ -125,7 +125,7 @@ class SkeletonGaitPP(BaseModel):
            },
            'visual_summary': {
                'image/sils': rearrange(pose * 255., 'n c s h w -> (n s) c h w'),
-           },
+           } if self.training and self.should_log_visuals else {},
            'inference_feat': {
                'embeddings': embed
            }
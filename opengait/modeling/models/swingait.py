@@ -845,6 +845,8 @@ class SwinGait(BaseModel):
         return optimizer
 
     def init_parameters(self):
+        if self.skip_init:
+            return
         for m in self.modules():
             if isinstance(m, nn.Linear):
                 trunc_normal_(m.weight, std=.02)
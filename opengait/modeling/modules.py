@@ -2,7 +2,9 @@ import torch
 import numpy as np
 import torch.nn as nn
 import torch.nn.functional as F
-from utils import clones, is_list_or_tuple
+from contextlib import contextmanager, nullcontext
+from torch.utils.checkpoint import checkpoint
+from utils import clones, is_list_or_tuple, recomputing
 from torchvision.ops import RoIAlign
 
 
@@ -26,7 +28,8 @@ class HorizontalPoolingPyramid():
         n, c = x.size()[:2]
         features = []
         for b in self.bin_num:
-            z = x.view(n, c, b, -1)
+            # a view for both the contiguous and the channels_last input
+            z = x.reshape(n, c, b, -1)
             z = z.mean(-1) + z.max(-1)[0]
             features.append(z)
         return torch.cat(features, -1)
@@ -36,6 +39,7 @@ class SetBlockWrapper(nn.Module):
     def __init__(self, forward_block):
         super(SetBlockWrapper, self).__init__()
         self.forward_block = forward_block
+        self.channels_last = False
 
     def forward(self, x, *args, **kwargs):
         """
@@ -43,12 +47,62 @@ class SetBlockWrapper(nn.Module):
             Out x: [n, c_out, s, h_out, w_out]
         """
         n, c, s, h, w = x.size()
+        if self.channels_last:
+            # laid out as [n, s, h, w, c] in memory, so no copy between the wrappers
+            x = self.forward_block(x.permute(0, 2, 3, 4, 1).reshape(
+                -1, h, w, c).permute(0, 3, 1, 2), *args, **kwargs)
+            output_size = x.size()
+            return x.permute(0, 2, 3, 1).reshape(
+                n, s, *output_size[2:], output_size[1]).permute(0, 4, 1, 2, 3)
         x = self.forward_block(x.transpose(
             1, 2).reshape(-1, c, h, w), *args, **kwargs)
         output_size = x.size()
         return x.reshape(n, s, *output_size[1:]).transpose(1, 2).contiguous()
 
 
+def checkpoint_module(module):
+    """Run the module by activation checkpointing in training: its activations are recomputed in the backward instead of being kept.
+
+    The forward of the module is patched in place, so the names of the parameters, and hence the checkpoints, are unchanged.
+    The in-place activations inside are turned off, not to modify the inputs kept for the recomputation, and the running
+     statistics of the BatchNorm layers are frozen during the recomputation, not to be updated twice. The recomputation
+     is marked by `recomputing`, e.g. for the profiler to skip it.
+    """
+    for m in module.modules():
+        if isinstance(m, (nn.ReLU, nn.ReLU6, nn.LeakyReLU, nn.ELU, nn.Hardswish, nn.SiLU)):
+            m.inplace = False
+    bns = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+
+    @contextmanager
+    def frozen_bn_stats():
+        states = [(bn.momentum, bn.num_batches_tracked.clone() if bn.num_batches_tracked is not None else None)
+                  for bn in bns]
+        for bn in bns:
+            bn.momentum = 0.
+        try:
+            yield
+        finally:
+            for bn, (momentum, num_batches_tracked) in zip(bns, states):
+                bn.momentum = momentum
+                if num_batches_tracked is not None:
+                    bn.num_batches_tracked.copy_(num_batches_tracked)
+
+    @contextmanager
+    def recomputation():
+        with recomputing(), frozen_bn_stats():
+            yield
+
+    forward = module.forward
+
+    def checkpointed_forward(*args, **kwargs):
+        if not (module.training and torch.is_grad_enabled()):
+            return forward(*args, **kwargs)
+        return checkpoint(forward, *args, use_reentrant=False,
+                          context_fn=lambda: (nullcontext(), recomputation()), **kwargs)
+    module.forward = checkpointed_forward
+    return module
+
+
 class PackSequenceWrapper(nn.Module):
     def __init__(self, pooling_func):
         super(PackSequenceWrapper, self).__init__()
@@ -61,7 +115,7 @@ class PackSequenceWrapper(nn.Module):
         """
         if seqL is None:
             return self.pooling_func(seqs, **options)
-        seqL = seqL[0].data.cpu().numpy().tolist()
+        seqL = seqL[0].tolist()
         start = [0] + np.cumsum(seqL).tolist()[:-1]
 
         rets = []
@@ -114,14 +168,19 @@ class SeparateBNNecks(nn.Module):
         Github: https://github.com/michuanhaohao/reid-strong-baseline
     """
 
-    def __init__(self, parts_num, in_channels, class_num, norm=True, parallel_BN1d=True):
+    def __init__(self, parts_num, in_channels, class_num, norm=True, parallel_BN1d=True, partial_fc=False):
+        """
+            partial_fc: if True, keep no classifier here and output the features instead of the logits, for `PartialFCLoss`.
+        """
         super(SeparateBNNecks, self).__init__()
         self.p = parts_num
         self.class_num = class_num
         self.norm = norm
-        self.fc_bin = nn.Parameter(
-            nn.init.xavier_uniform_(
-                torch.zeros(parts_num, in_channels, class_num)))
+        self.partial_fc = partial_fc
+        if not partial_fc:
+            self.fc_bin = nn.Parameter(
+                nn.init.xavier_uniform_(
+                    torch.zeros(parts_num, in_channels, class_num)))
         if parallel_BN1d:
             self.bn1d = nn.BatchNorm1d(in_channels * parts_num)
         else:
@@ -141,6 +200,11 @@ class SeparateBNNecks(nn.Module):
             x = torch.cat([bn(_x) for _x, bn in zip(
                 x.split(1, 2), self.bn1d)], 2)  # [p, n, c]
         feature = x.permute(2, 0, 1).contiguous()
+        if self.partial_fc:
+            # classified by the sharded centres of PartialFCLoss
+            feature = F.normalize(feature, dim=-1) if self.norm else feature
+            feature = feature.permute(1, 2, 0).contiguous()
+            return feature, feature
         if self.norm:
             feature = F.normalize(feature, dim=-1)  # [p, n, c]
             logits = feature.matmul(F.normalize(
@@ -0,0 +1,135 @@
+"""Post-training static int8 quantization for CPU inference.
+
+The whole gait model can not be traced by `torch.fx` (dict inputs, `seqL` driven python logic,
+ einops, etc.), so we quantize the conv-heavy frame-level stacks only. Each `SetBlockWrapper`
+ flattens the input to `[n*s, c, h, w]` before calling its `forward_block`, which is the
+ traceable part and where most of the FLOPs are. These blocks are quantized in fx graph mode,
+ so they take and return float tensors and the reshape/transpose in `SetBlockWrapper` keeps
+ working on float data. The set-level heads like `HorizontalPoolingPyramid` and `SeparateFCs`
+ stay in float32: they work on pooled features only and their batched matmul has no int8 kernel.
+
+Typical usage:
+
+blocks = prepare_quantization(model, model.test_loader, backend='fbgemm', modules=['gl_block2'])
+calibrate(model, model.test_loader, calibration_seqs=256)
+convert_quantization(model, blocks)
+"""
+import torch
+import torch.nn as nn
+
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+from .modules import SetBlockWrapper
+from utils import get_msg_mgr, is_list_or_tuple
+
+__all__ = ['prepare_quantization', 'calibrate', 'convert_quantization']
+
+
+def _get_module(model, name):
+    module = model
+    for attr in name.split('.'):
+        module = getattr(module, attr)
+    return module
+
+
+def _set_module(model, name, new_module):
+    parent_name, _, attr = name.rpartition('.')
+    parent = _get_module(model, parent_name) if parent_name else model
+    setattr(parent, attr, new_module)
+
+
+def find_quantizable_blocks(model, modules=[]):
+    """Find the names of the blocks to be quantized.
+
+    Args:
+        model: the model.
+        modules: the names of extra sub-modules working on [n, c, h, w] input, e.g. `gl_block2` of GaitSet.
+    Returns:
+        list: the names of the blocks, the `forward_block` of the outermost `SetBlockWrapper`s and the extra modules.
+    """
+    blocks = []
+    for name, module in model.named_modules():
+        if any(name.startswith(blk + '.') for blk in blocks):
+            # nested in a block found before
+            continue
+        if isinstance(module, SetBlockWrapper) and isinstance(module.forward_block, nn.Module):
+            blocks.append(name + '.forward_block' if name else 'forward_block')
+    for name in modules:
+        if name not in blocks:
+            blocks.append(name)
+    return blocks
+
+
+def _capture_example_inputs(model, blocks, inputs):
+    """Run one batch to get the example input of every block."""
+    example_inputs = {}
+    handles = []
+    for name in blocks:
+        def hook(module, args, name=name):
+            if name not in example_inputs:
+                example_inputs[name] = tuple(args)
+        handles.append(_get_module(model, name).register_forward_pre_hook(hook))
+    with torch.no_grad():
+        model(model.inputs_pretreament(inputs))
+    for handle in handles:
+        handle.remove()
+    return example_inputs
+
+
+def prepare_quantization(model, loader, backend='fbgemm', modules=[]):
+    """Insert the observers into the quantizable blocks.
+
+    Args:
+        model: the model on cpu, in eval mode.
+        loader: the loader to fetch one batch for the example inputs.
+        backend: the quantized engine, `fbgemm`/`x86` for x86 CPUs and `qnnpack` for ARM CPUs.
+        modules: the names of extra sub-modules to be quantized.
+    Returns:
+        list: the names of the prepared blocks.
+    """
+    msg_mgr = get_msg_mgr()
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+
+    blocks = find_quantizable_blocks(model, modules)
+    example_inputs = _capture_example_inputs(model, blocks, next(iter(loader)))
+
+    prepared = []
+    for name in blocks:
+        if name not in example_inputs:
+            msg_mgr.log_warning("Block %s is never called, skip it." % name)
+            continue
+        try:
+            block = prepare_fx(_get_module(model, name), qconfig_mapping, example_inputs[name])
+        except Exception as e:
+            # e.g. the python control flow over the tensor size in FocalConv2d
+            msg_mgr.log_warning("Can not trace %s, keep it in float32: %s" % (name, e))
+            continue
+        _set_module(model, name, block)
+        prepared.append(name)
+    msg_mgr.log_info("-------- Quantized Blocks --------")
+    msg_mgr.log_info(prepared)
+    return prepared
+
+
+def calibrate(model, loader, calibration_seqs=256):
+    """Feed the sequences from the loader to collect the activation statistics."""
+    seqs_num = 0
+    with torch.no_grad():
+        for inputs in loader:
+            ipts = model.inputs_pretreament(inputs)
+            model(ipts)
+            seqs_num += len(ipts[1])
+            if seqs_num >= calibration_seqs:
+                break
+    get_msg_mgr().log_info("Calibrated with %d sequences." % seqs_num)
+
+
+def convert_quantization(model, blocks):
+    """Convert the calibrated blocks to the int8 ones."""
+    if not is_list_or_tuple(blocks):
+        blocks = [blocks]
+    for name in blocks:
+        _set_module(model, name, convert_fx(_get_module(model, name)))
+    return model
@@ -1,10 +1,15 @@
-from .common import get_ddp_module, ddp_all_gather
+from .common import get_ddp_module, ddp_all_gather, ddp_all_gather_coalesced
 from .common import Odict, Ntuple
 from .common import get_valid_args
 from .common import is_list_or_tuple, is_bool, is_str, is_list, is_dict, is_tensor, is_array, config_loader, init_seeds, handler, params_count
-from .common import ts2np, ts2var, np2var, list2var
+from .common import ts2np, ts2var, np2var, list2var, get_device, record_syncs
+from .common import recomputing, is_recomputing
 from .common import mkdir, clones
 from .common import MergeCfgsDict
 from .common import get_attr_from
 from .common import NoOp
-from .msg_manager import get_msg_mgr
\ No newline at end of file
+from .msg_manager import get_msg_mgr
+from .timer import StageTimer
+from .checkpoint import CheckpointSaver
+from .profiler import ModuleProfiler
+from .registry import LazyRegistry
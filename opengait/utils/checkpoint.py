@@ -0,0 +1,101 @@
+import io
+import os
+import re
+import glob
+import threading
+import torch
+
+from .msg_manager import get_msg_mgr
+
+
+class CheckpointSaver:
+    """Save the checkpoints without blocking the training.
+
+    The checkpoint is serialized into the host memory, including the copy from the device, on the calling thread,
+     so the training can go on modifying the parameters right after. The write to disk, the slow part for large
+     models and network file systems, runs on a background thread: to a temporary file first, then renamed to
+     the final path, so a checkpoint on the disk is never partially written. A save waits for the previous write.
+     The pinned checkpoints are kept by the retention until released.
+    """
+
+    def __init__(self, async_save=False, keep_last=0):
+        """
+        Args:
+            async_save: write in the background if `True`, or on the calling thread.
+            keep_last: keep the latest `keep_last` checkpoints of the same save name and delete the older ones, 0 to keep all.
+        """
+        self.async_save = async_save
+        self.keep_last = keep_last
+        self.thread = None
+        self.error = None
+        # the checkpoints not to be deleted by the retention, e.g. those still to be tested in the background
+        self.pinned = set()
+        self.lock = threading.Lock()
+
+    def save(self, checkpoint, path):
+        self.wait()
+        buffer = io.BytesIO()
+        torch.save(checkpoint, buffer)
+        if self.async_save:
+            self.thread = threading.Thread(target=self._write, args=(buffer, path), name='CheckpointSaver')
+            self.thread.start()
+        else:
+            self._write(buffer, path)
+            self._raise()
+
+    def wait(self):
+        """Block until the previous write finishes, and raise its error if any."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._raise()
+
+    def pin(self, path):
+        """Keep the checkpoint from the retention of `keep_last` until it is released."""
+        with self.lock:
+            self.pinned.add(os.path.normpath(path))
+
+    def release(self, path):
+        """Release a pinned checkpoint, deleted now if it is out of the latest `keep_last`."""
+        with self.lock:
+            self.pinned.discard(os.path.normpath(path))
+        if self.keep_last > 0:
+            self._remove_old(path)
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _write(self, buffer, path):
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getbuffer())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            if self.keep_last > 0:
+                self._remove_old(path)
+        except Exception as e:
+            self.error = e
+
+    def _remove_old(self, path):
+        """Delete the older checkpoints named `{save_name}-{iteration}.pt` in the same directory."""
+        save_dir, name = os.path.split(path)
+        matched = re.match(r'(.*)-\d+\.pt$', name)
+        if matched is None:
+            return
+        prefix = matched.group(1)
+        pattern = re.compile(re.escape(prefix) + r'-(\d+)\.pt$')
+        ckpts = []
+        for ckpt in glob.glob(os.path.join(glob.escape(save_dir), glob.escape(prefix) + '-*.pt')):
+            matched = pattern.match(os.path.basename(ckpt))
+            if matched is not None:
+                ckpts.append((int(matched.group(1)), ckpt))
+        with self.lock:
+            for _, ckpt in sorted(ckpts)[:-self.keep_last]:
+                if os.path.normpath(ckpt) in self.pinned or not os.path.exists(ckpt):
+                    continue
+                os.remove(ckpt)
+                get_msg_mgr().log_info("Removed the old checkpoint %s" % ckpt)
@@ -8,6 +8,8 @@ import torch.nn as nn
 import torch.autograd as autograd
 import yaml
 import random
+import warnings
+from contextlib import contextmanager
 from torch.nn.parallel import DistributedDataParallel as DDP
 from collections import OrderedDict, namedtuple
 
@@ -102,8 +104,56 @@ def ts2np(x):
     return x.cpu().data.numpy()
 
 
+def get_device():
+    if torch.cuda.is_available():
+        return torch.device("cuda", torch.cuda.current_device())
+    return torch.device("cpu")
+
+
+_recomputing = 0
+
+
+@contextmanager
+def recomputing():
+    """Mark the forward run again in the backward by the activation checkpointing, see `is_recomputing`."""
+    global _recomputing
+    _recomputing += 1
+    try:
+        yield
+    finally:
+        _recomputing -= 1
+
+
+def is_recomputing():
+    """Whether the forward is run again in the backward by the activation checkpointing, e.g. not to be profiled twice."""
+    return _recomputing > 0
+
+
+@contextmanager
+def record_syncs(enabled=True):
+    """Record the host-device synchronizations raised by the cuda operations within the context.
+
+    Yields:
+        list: filled with the locations of the synchronizations when the context exits.
+    """
+    syncs = []
+    if not enabled or not torch.cuda.is_available():
+        yield syncs
+        return
+    prev_mode = torch.cuda.get_sync_debug_mode()
+    torch.cuda.set_sync_debug_mode('warn')
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            yield syncs
+    finally:
+        torch.cuda.set_sync_debug_mode(prev_mode)
+    syncs.extend('%s:%d' % (w.filename, w.lineno) for w in caught
+                 if 'synchronizing' in str(w.message))
+
+
 def ts2var(x, **kwargs):
-    return autograd.Variable(x, **kwargs).cuda()
+    return autograd.Variable(x, **kwargs).to(get_device())
 
 
 def np2var(x, **kwargs):
@@ -181,6 +231,37 @@ def ddp_all_gather(features, dim=0, requires_grad=True):
     return feature
 
 
+def ddp_all_gather_coalesced(tensors, requires_grad=True):
+    '''
+        The same as `ddp_all_gather` along dim 0 for each of the tensors, but in a single collective:
+            the tensors of any dtype are flattened into one byte buffer, gathered at once and split back.
+        inputs: list of [n, ...]
+    '''
+    world_size = torch.distributed.get_world_size()
+    rank = torch.distributed.get_rank()
+    tensors = [t.contiguous() for t in tensors]
+    buffer = torch.cat([t.detach().view(-1).view(torch.uint8) for t in tensors])
+    gathered = buffer.new_empty(world_size, buffer.numel())
+    if torch.distributed.get_backend() == 'nccl' and hasattr(torch.distributed, 'all_gather_into_tensor'):
+        torch.distributed.all_gather_into_tensor(gathered, buffer)
+    else:
+        torch.distributed.all_gather(list(gathered.unbind(0)), buffer)
+
+    features, offset = [], 0
+    for t in tensors:
+        nbytes = t.numel() * t.element_size()
+        feature = gathered[:, offset:offset + nbytes].contiguous().view(t.dtype).view(world_size, *t.shape)
+        offset += nbytes
+        if requires_grad and t.requires_grad:
+            feature = list(feature.unbind(0))
+            feature[rank] = t
+            feature = torch.cat(feature, dim=0)
+        else:
+            feature = feature.view(world_size * t.size(0), *t.shape[1:])
+        features.append(feature)
+    return features
+
+
 # https://github.com/pytorch/pytorch/issues/16885
 class DDPPassthrough(DDP):
     def __getattr__(self, name):
@@ -191,9 +272,12 @@ class DDPPassthrough(DDP):
 
 
 def get_ddp_module(module, find_unused_parameters=False, **kwargs):
-    if len(list(module.parameters())) == 0:
-        # for the case that loss module has not parameters.
+    if len([p for p in module.parameters() if not getattr(p, 'sharded', False)]) == 0:
+        # for the case that loss module has not parameters, or only the ones sharded across the ranks, e.g. PartialFCLoss.
         return module
+    if not torch.cuda.is_available():
+        # for the cpu case, e.g. the gloo backend.
+        return DDPPassthrough(module, find_unused_parameters=find_unused_parameters, **kwargs)
     device = torch.cuda.current_device()
     module = DDPPassthrough(module, device_ids=[device], output_device=device,
                             find_unused_parameters=find_unused_parameters, **kwargs)
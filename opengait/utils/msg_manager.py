@@ -1,4 +1,6 @@
 import time
+import queue
+import threading
 import torch
 
 import numpy as np
@@ -11,19 +13,40 @@ from .common import is_list, is_tensor, ts2np, mkdir, Odict, NoOp
 import logging
 
 
+def reduce_mean(values):
+    """Average the values, the tensors among them are reduced on their device and copied to the host at once."""
+    tensors = [v.float().mean() for v in values if is_tensor(v)]
+    values = [float(np.mean(v)) for v in values if not is_tensor(v)]
+    if len(tensors) > 0:
+        values += ts2np(torch.stack(tensors)).tolist()
+    return np.mean(values)
+
+
 class MessageManager:
     def __init__(self):
         self.info_dict = Odict()
         self.writer_hparams = ['image', 'scalar']
         self.time = time.time()
-
-    def init_manager(self, save_path, log_to_file, log_iter, iteration=0):
+        self.max_images = 0
+        self.queue = None
+
+    def init_manager(self, save_path, log_to_file, log_iter, iteration=0, async_write=False, queue_size=8, max_images=0):
+        """
+        Args:
+            async_write: write the summaries and the training information on a background thread.
+            queue_size: the number of the writes waiting for the thread, the image summaries are dropped when it is full.
+            max_images: write the first `max_images` images of each image summary only, 0 for all.
+        """
         self.iteration = iteration
         self.log_iter = log_iter
+        self.max_images = max_images
         mkdir(osp.join(save_path, "summary/"))
         self.writer = SummaryWriter(
             osp.join(save_path, "summary/"), purge_step=self.iteration)
         self.init_logger(save_path, log_to_file)
+        if async_write:
+            self.queue = queue.Queue(queue_size)
+            threading.Thread(target=self._work, name='MessageManager', daemon=True).start()
 
     def init_logger(self, save_path, log_to_file):
         # init logger
@@ -46,27 +69,74 @@ class MessageManager:
         self.logger.addHandler(console)
 
     def append(self, info):
+        # the tensors are kept on the device and reduced in log_training_info, not to sync per iteration.
         for k, v in info.items():
             v = [v] if not is_list(v) else v
-            v = [ts2np(_) if is_tensor(_) else _ for _ in v]
+            v = [_.detach() if is_tensor(_) else _ for _ in v]
             info[k] = v
         self.info_dict.append(info)
 
+    def _work(self):
+        while True:
+            func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                self.log_warning("Failed to write the summary: {!r}".format(e))
+            finally:
+                self.queue.task_done()
+
+    def _submit(self, func, *args):
+        """Run on the writer thread if any, blocked when its queue is full."""
+        if self.queue is None:
+            func(*args)
+        else:
+            self.queue.put((func, args))
+
+    def wait(self):
+        """Block until all the submitted writes are done."""
+        if self.queue is not None:
+            self.queue.join()
+
     def flush(self):
         self.info_dict.clear()
-        self.writer.flush()
+        self._submit(self.writer.flush)
 
-    def write_to_tensorboard(self, summary):
+    def write_to_tensorboard(self, summary, iteration=None):
+        iteration = self.iteration if iteration is None else iteration
 
+        # the lazy summaries are computed on the calling thread, only the writes go to the writer thread
+        summary_ = {}
         for k, v in summary.items():
             module_name = k.split('/')[0]
             if module_name not in self.writer_hparams:
                 self.log_warning(
                     'Not Expected --Summary-- type [{}] appear!!!{}'.format(k, self.writer_hparams))
                 continue
+            v = v() if callable(v) else v
+            v = v.detach() if is_tensor(v) else v
+            if module_name == 'image' and self.max_images > 0:
+                v = v[:self.max_images]
+            summary_[k] = v
+
+        if self.queue is None:
+            self._write_summary(summary_, iteration)
+            return
+        try:
+            self.queue.put_nowait((self._write_summary, (summary_, iteration)))
+        except queue.Full:
+            # the writer falls behind, e.g. on a slow file system: drop the images and wait for the scalars only
+            scalars = {k: v for k, v in summary_.items() if not k.startswith('image/')}
+            if len(scalars) < len(summary_):
+                self.log_warning("The summary writer falls behind, {} image summaries of iteration {:0>5} dropped.".format(
+                    len(summary_) - len(scalars), iteration))
+            self._submit(self._write_summary, scalars, iteration)
+
+    def _write_summary(self, summary, iteration):
+        for k, v in summary.items():
+            module_name = k.split('/')[0]
             board_name = k.replace(module_name + "/", '')
             writer_module = getattr(self.writer, 'add_' + module_name)
-            v = v.detach() if is_tensor(v) else v
             v = vutils.make_grid(
                 v, normalize=True, scale_each=True) if 'image' in module_name else v
             if module_name == 'scalar':
@@ -74,20 +144,24 @@ class MessageManager:
                     v = v.mean()
                 except:
                     v = v
-            writer_module(board_name, v, self.iteration)
+            writer_module(board_name, v, iteration)
 
     def log_training_info(self):
         now = time.time()
+        # reduced on the writer thread, where the copy of the device values to the host waits for the device
+        self._submit(self._log_training_info, self.iteration, now - self.time, Odict(self.info_dict))
+        self.reset_time()
+
+    def _log_training_info(self, iteration, cost, info_dict):
         string = "Iteration {:0>5}, Cost {:.2f}s".format(
-            self.iteration, now-self.time, end="")
-        for i, (k, v) in enumerate(self.info_dict.items()):
+            iteration, cost, end="")
+        for i, (k, v) in enumerate(info_dict.items()):
             if 'scalar' not in k:
                 continue
             k = k.replace('scalar/', '').replace('/', '_')
-            end = "\n" if i == len(self.info_dict)-1 else ""
-            string += ", {0}={1:.4f}".format(k, np.mean(v), end=end)
+            end = "\n" if i == len(info_dict)-1 else ""
+            string += ", {0}={1:.4f}".format(k, reduce_mean(v), end=end)
         self.log_info(string)
-        self.reset_time()
 
     def reset_time(self):
         self.time = time.time()
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import math
+import fnmatch
+import torch
+import torch.nn as nn
+
+from .common import Odict, is_tensor, is_list_or_tuple, is_dict, mkdir, is_recomputing
+from .msg_manager import get_msg_mgr
+
+
+def flatten_tensors(obj):
+    """Get the tensors in the nested lists, tuples and dicts, e.g. the inputs and the outputs of a module."""
+    if is_tensor(obj):
+        return [obj]
+    if is_list_or_tuple(obj):
+        return sum([flatten_tensors(o) for o in obj], [])
+    if is_dict(obj):
+        return sum([flatten_tensors(o) for o in obj.values()], [])
+    return []
+
+
+def estimate_flops(module, inputs, output):
+    """Estimate the FLOPs of the convolutions, the linear layers and the separate FCs, 0 for the others."""
+    if isinstance(module, nn.modules.conv._ConvNd) and is_tensor(output):
+        return 2 * output.numel() * module.in_channels // module.groups * math.prod(module.kernel_size)
+    if isinstance(module, nn.Linear) and is_tensor(output):
+        return 2 * output.numel() * module.in_features
+    # [p, c_in, c_out], e.g. SeparateFCs and SeparateBNNecks, applied to the inputs of [n, c_in, p]
+    fc_bin = getattr(module, 'fc_bin', None)
+    if isinstance(fc_bin, nn.Parameter) and fc_bin.dim() == 3 and len(inputs) > 0 and is_tensor(inputs[0]):
+        p, c_in, c_out = fc_bin.size()
+        return 2 * inputs[0].size(0) * p * c_in * c_out
+    return 0
+
+
+def match_modules(model, patterns):
+    """Get the named submodules matching the patterns, dot by dot, e.g. `layer*` or `backbone.blocks.*`.
+
+    The children of the model, except the loss aggregator, are taken if no pattern is given.
+    """
+    if not patterns:
+        return Odict((name, m) for name, m in model.named_children() if name != 'loss_aggregator')
+    modules = Odict()
+    for name, m in model.named_modules():
+        parts = name.split('.')
+        for pattern in patterns:
+            pattern = pattern.split('.')
+            if name and len(pattern) == len(parts) and all(fnmatch.fnmatchcase(n, p) for n, p in zip(parts, pattern)):
+                modules[name] = m
+                break
+    return modules
+
+
+class ModuleProfiler:
+    """Profile the forward and the backward of the named submodules over a window of training iterations.
+
+    The forward of each submodule is timed between its forward pre-hook and hook, and its backward between the
+     hooks of the gradients of its output and its input, by cuda events read once at the end of the window, so
+     no host-device sync is added to the steps. The times are inclusive: a profiled submodule of another counts
+     in both. Besides the times, each submodule gets the bytes of its outputs, the bytes allocated and kept by
+     its forward (the activations saved for the backward and the outputs, cuda only), and the estimated FLOPs
+     of the convolutions, the linear layers and the separate FCs within it.
+
+    The ranked table is logged and saved to `profile/modules.txt`, and the calls to `profile/trace.json`, to be
+     opened by `chrome://tracing` or Perfetto. It profiles the eager forward, not the compiled one. The forwards
+     run again in the backward by the activation checkpointing are not recorded: their time counts in the
+     backward of the checkpointed module, and their FLOPs and memory are not counted twice.
+    """
+
+    def __init__(self, model, modules=None, skip_iters=10, iters=10, save_path='./'):
+        """
+        Args:
+            modules: the names or the patterns of the submodules, the children of the model if empty.
+            skip_iters: the iterations to skip before the window, for the warmup.
+            iters: the iterations of the window.
+        """
+        self.msg_mgr = get_msg_mgr()
+        self.use_cuda = torch.cuda.is_available()
+        self.skip_iters = skip_iters
+        self.iters = iters
+        self.save_path = os.path.join(save_path, 'profile/')
+        self.modules = match_modules(model, modules)
+        if len(self.modules) == 0:
+            raise ValueError("No submodule of the model matches {}.".format(modules))
+        self.records = Odict((name, {'calls': 0, 'forward': [], 'backward': [], 'output_bytes': 0,
+                                     'kept_bytes': 0, 'flops': 0}) for name in self.modules)
+        self.starts = {name: [] for name in self.modules}
+        self.stack = []
+        self.handles = []
+        self.first_iter = None
+        self.origin = None
+        self.active = False
+        self.done = False
+        for name, m in self.modules.items():
+            self.handles.append(m.register_forward_pre_hook(self._pre_hook(name)))
+            self.handles.append(m.register_forward_hook(self._hook(name)))
+        for m in model.modules():
+            self.handles.append(m.register_forward_hook(self._count_flops))
+        self.msg_mgr.log_info("Profiling the modules {} for {} iterations after {}".format(
+            list(self.modules.keys()), iters, skip_iters))
+
+    def _mark(self):
+        if self.use_cuda:
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    def _elapsed(self, start, end):
+        """In ms."""
+        if self.use_cuda:
+            return start.elapsed_time(end)
+        return (end - start) * 1000
+
+    def _memory(self):
+        return torch.cuda.memory_allocated() if self.use_cuda else 0
+
+    def _pre_hook(self, name):
+        def hook(module, inputs):
+            if not self.active or is_recomputing():
+                return
+            self.stack.append(name)
+            self.starts[name].append((self._mark(), self._memory()))
+        return hook
+
+    def _hook(self, name):
+        def hook(module, inputs, output):
+            if not self.active or is_recomputing() or len(self.starts[name]) == 0:
+                return
+            start, memory = self.starts[name].pop()
+            end = self._mark()
+            self.stack.remove(name)
+            record = self.records[name]
+            record['calls'] += 1
+            record['forward'].append((start, end))
+            record['output_bytes'] += sum(t.numel() * t.element_size() for t in flatten_tensors(output))
+            record['kept_bytes'] += self._memory() - memory
+            if torch.is_grad_enabled():
+                self._hook_backward(name, inputs, output)
+        return hook
+
+    def _hook_backward(self, name, inputs, output):
+        """Mark the backward of the module from the gradient of its output to the one of its input."""
+        outputs = [t for t in flatten_tensors(output) if t.requires_grad]
+        inputs = [t for t in flatten_tensors(inputs) if t.requires_grad]
+        if len(outputs) == 0 or len(inputs) == 0:
+            return
+        marks = {}
+
+        def start(grad):
+            marks.setdefault('start', self._mark())
+
+        def end(grad):
+            if 'start' in marks and 'end' not in marks:
+                marks['end'] = self._mark()
+                self.records[name]['backward'].append((marks['start'], marks['end']))
+        outputs[0].register_hook(start)
+        inputs[0].register_hook(end)
+
+    def _count_flops(self, module, inputs, output):
+        if not self.active or is_recomputing() or len(self.stack) == 0:
+            return
+        flops = estimate_flops(module, inputs, output)
+        if flops > 0:
+            for name in set(self.stack):
+                self.records[name]['flops'] += flops
+
+    def step(self, iteration):
+        """Called before each forward of the training, with the number of the iterations done."""
+        if self.done:
+            return
+        if self.first_iter is None:
+            self.first_iter = iteration
+        if iteration >= self.first_iter + self.skip_iters + self.iters:
+            self.close()
+        elif iteration >= self.first_iter + self.skip_iters and not self.active:
+            self.active = True
+            self.origin = self._mark()
+
+    def close(self):
+        """Stop profiling, remove the hooks and report the window, if any."""
+        if self.done:
+            return
+        self.done = True
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        if self.active:
+            self.active = False
+            self.report()
+
+    def report(self):
+        if self.use_cuda:
+            torch.cuda.synchronize()
+        rows, events = [], []
+        for name, record in self.records.items():
+            forward_ms = sum(self._elapsed(s, e) for s, e in record['forward']) / self.iters
+            backward_ms = sum(self._elapsed(s, e) for s, e in record['backward']) / self.iters
+            rows.append((name, forward_ms, backward_ms, record['calls'] / self.iters,
+                         record['output_bytes'] / self.iters / 2 ** 20, record['kept_bytes'] / self.iters / 2 ** 20,
+                         record['flops'] / self.iters / 1e9))
+            for tid, phase in enumerate(['forward', 'backward']):
+                for s, e in record[phase]:
+                    events.append({'name': name, 'cat': phase, 'ph': 'X', 'pid': 0, 'tid': tid,
+                                   'ts': self._elapsed(self.origin, s) * 1000, 'dur': self._elapsed(s, e) * 1000})
+        rows.sort(key=lambda row: row[1] + row[2], reverse=True)
+        header = "{:<40}{:>14}{:>14}{:>10}{:>14}{:>14}{:>12}".format(
+            'module', 'forward_ms', 'backward_ms', 'calls', 'output_mb', 'kept_mb', 'gflops')
+        table = [header] + ["{:<40}{:>14.3f}{:>14.3f}{:>10.1f}{:>14.2f}{:>14.2f}{:>12.3f}".format(*row) for row in rows]
+        table = '\n'.join(table)
+        self.msg_mgr.log_info("Modules per iteration over {} iterations, the times are inclusive:\n{}".format(
+            self.iters, table))
+        if torch.distributed.get_rank() > 0:
+            return
+        mkdir(self.save_path)
+        with open(os.path.join(self.save_path, 'modules.txt'), 'w') as f:
+            f.write(table + '\n')
+        events += [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tid, 'args': {'name': phase}}
+                   for tid, phase in enumerate(['forward', 'backward'])]
+        with open(os.path.join(self.save_path, 'trace.json'), 'w') as f:
+            json.dump({'traceEvents': events}, f)
+        self.msg_mgr.log_info("Profile saved in {}".format(self.save_path))
@@ -0,0 +1,80 @@
+import ast
+import sys
+from pathlib import Path
+from pkgutil import iter_modules
+from importlib import import_module
+
+
+class LazyRegistry:
+    """Register the classes of the modules of a package by their names, and import them on the first access.
+
+    The class names are read from the sources without importing them, so an access like
+     `getattr(models, model_cfg['model'])` imports the module of the class only, not all the models and their
+     heavy dependencies. A class defined in several modules is taken from the last one, in the order of
+     `iter_modules`, as the former eager import of all the modules did. A name defined in no module, e.g. a class
+     imported from elsewhere, falls back to importing all the modules.
+
+    Usage, in the `__init__.py` of the package:
+        __getattr__, __dir__ = LazyRegistry(__name__, __file__).hooks()
+    """
+
+    def __init__(self, package, init_file):
+        self.package = package
+        package_dir = Path(init_file).resolve().parent
+        self.module_names = []
+        self.index = {}
+        for _, module_name, ispkg in iter_modules([str(package_dir)]):
+            self.module_names.append(module_name)
+            path = package_dir / module_name / '__init__.py' if ispkg else package_dir / (module_name + '.py')
+            for class_name in self.class_names(path):
+                self.index[class_name] = module_name
+        self.all_imported = False
+
+    @staticmethod
+    def class_names(path):
+        """Get the names of the classes defined at the top level of the source file."""
+        try:
+            tree = ast.parse(path.read_text(encoding='utf-8'), str(path))
+        except (OSError, SyntaxError):
+            return []
+        return [node.name for node in tree.body if isinstance(node, ast.ClassDef)]
+
+    def _cache(self, name, attribute):
+        # set on the package, so `__getattr__` is not called again for it
+        setattr(sys.modules[self.package], name, attribute)
+        return attribute
+
+    def import_all(self):
+        """Import all the modules and register all their classes, including the imported ones."""
+        if self.all_imported:
+            return
+        self.all_imported = True
+        for module_name in self.module_names:
+            try:
+                module = import_module('{}.{}'.format(self.package, module_name))
+            except ImportError:
+                # e.g. the optional dependency of a model which is not used
+                continue
+            for attribute_name in dir(module):
+                attribute = getattr(module, attribute_name)
+                if isinstance(attribute, type) and attribute_name not in self.index:
+                    self._cache(attribute_name, attribute)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name in self.index:
+            module = import_module('{}.{}'.format(self.package, self.index[name]))
+            return self._cache(name, getattr(module, name))
+        self.import_all()
+        package = sys.modules[self.package]
+        if name in package.__dict__:
+            return package.__dict__[name]
+        raise AttributeError("module '{}' has no attribute '{}'".format(self.package, name))
+
+    def __dir__(self):
+        return sorted(set(sys.modules[self.package].__dict__) | set(self.index))
+
+    def hooks(self):
+        """The module-level `__getattr__` and `__dir__` of the package."""
+        return self.__getattr__, self.__dir__
@@ -0,0 +1,98 @@
+import time
+import resource
+import torch
+
+from contextlib import contextmanager
+from .common import Odict
+
+
+class StageTimer:
+    """Time the stages of the training step and count the throughput.
+
+    The device stages are timed by cuda events, which are recorded asynchronously and read only in `summary`,
+     so the timing adds no host-device sync to the step. The host stages, e.g. waiting for the data or the
+     pretreatment of the inputs, and all the stages on cpu are timed by the perf counter. A step is one
+     optimizer step, over all the micro-batches accumulated for it.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.use_cuda = torch.cuda.is_available()
+        self.reset()
+
+    def reset(self):
+        self.host_times = Odict()
+        self.events = Odict()
+        self.steps = 0
+        self.seqs_num = 0
+        self.frames_num = 0
+        self.start_time = time.perf_counter()
+        if self.enabled and self.use_cuda:
+            torch.cuda.reset_peak_memory_stats()
+
+    @contextmanager
+    def stage(self, name, host=False):
+        """Time the code within the context as the stage `name`, `host` for the stages blocking the host only."""
+        if not self.enabled:
+            yield
+            return
+        if self.use_cuda and not host:
+            start = torch.cuda.Event(enable_timing=True)
+            end = torch.cuda.Event(enable_timing=True)
+            start.record()
+            yield
+            end.record()
+            self.events.setdefault(name, []).append((start, end))
+        else:
+            start = time.perf_counter()
+            yield
+            self.host_times[name] = self.host_times.get(
+                name, 0.) + time.perf_counter() - start
+
+    def time_iter(self, iterable, name='data'):
+        """Iterate the iterable, e.g. the loader, and time the waiting for each item as a host stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name, host=True):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, seqs_num, frames_num, step=True):
+        """Count the numbers of sequences and frames of a micro-batch, `step` if the optimizer stepped after it."""
+        self.steps += int(step)
+        self.seqs_num += seqs_num
+        self.frames_num += frames_num
+
+    def summary(self):
+        """Get the time per step of each stage in ms, the throughput and the peak memory since the last summary, then reset.
+
+        The throughput is of all the processes, supposing they run the same batch size.
+        """
+        if not self.enabled or self.steps == 0:
+            return {}
+        if self.use_cuda:
+            torch.cuda.synchronize()
+        cost = time.perf_counter() - self.start_time
+        world_size = torch.distributed.get_world_size()
+
+        stage_times = Odict(self.host_times)
+        for name, events in self.events.items():
+            stage_times[name] = stage_times.get(name, 0.) + \
+                sum(start.elapsed_time(end) for start, end in events) / 1000
+        summary = Odict()
+        for name, stage_time in stage_times.items():
+            summary['scalar/timing/%s_ms' % name] = stage_time / self.steps * 1000
+        summary['scalar/timing/step_ms'] = cost / self.steps * 1000
+        summary['scalar/throughput/seqs_per_second'] = self.seqs_num * world_size / cost
+        summary['scalar/throughput/frames_per_second'] = self.frames_num * world_size / cost
+        if self.use_cuda:
+            summary['scalar/memory/peak_allocated_mb'] = torch.cuda.max_memory_allocated() / 2 ** 20
+        else:
+            # in KB on Linux, the peak of the whole run
+            summary['scalar/memory/peak_rss_mb'] = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+        self.reset()
+        return summary
@@ -0,0 +1,5 @@
+import sys
+import os.path as osp
+
+# the packages of OpenGait are imported from `opengait/`, as by `main.py`
+sys.path.insert(0, osp.join(osp.dirname(osp.abspath(__file__)), '..', 'opengait'))
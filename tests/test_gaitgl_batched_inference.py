@@ -0,0 +1,31 @@
+"""The padded batch of the testing sequences of GaitGL against one sequence at a time."""
+import pytest
+
+torch = pytest.importorskip('torch')
+nn = torch.nn
+
+
+def build_gaitgl(dataset_name):
+    from modeling.models.gaitgl import GaitGL
+    # the network only, without the loaders, the optimizer and the distributed setup of `BaseModel`
+    model = GaitGL.__new__(GaitGL)
+    nn.Module.__init__(model)
+    model.cfgs = {'data_cfg': {'dataset_name': dataset_name}}
+    model.build_network({'channels': [8, 16, 32, 32], 'class_num': 4})
+    return model.eval()
+
+
+@pytest.mark.parametrize('dataset_name', ['CASIA-B', 'OUMVLP'])
+def test_padded_matches_per_sequence(dataset_name):
+    torch.manual_seed(0)
+    model = build_gaitgl(dataset_name)
+    lengths = [7, 12, 2, 9, 1]
+    seqs = [torch.rand(1, length, 64, 44) for length in lengths]
+    with torch.no_grad():
+        expected = torch.cat([model(([seq], None, None, None, None))['inference_feat']['embeddings']
+                              for seq in seqs])
+        seqL = torch.tensor([lengths])
+        batched = model(([torch.cat(seqs, 1)], None, None, None, seqL))['inference_feat']['embeddings']
+    assert batched.shape == expected.shape
+    assert torch.allclose(batched, expected, atol=1e-5)
+
@@ -0,0 +1,53 @@
+"""`PartialFCLoss` on 2 cpu ranks against the dense classifier of all the classes over the whole batch."""
+import pytest
+
+torch = pytest.importorskip('torch')
+F = torch.nn.functional
+mp = torch.multiprocessing
+
+WORLD_SIZE = 2
+CLASS_NUM, PARTS, CHANNELS, BATCH = 5, 3, 8, 4  # the batch of each rank, 5 classes for a padded shard
+
+
+def dense_grads(features, labels, centres, scale, eps):
+    """The gradients of the mean loss over the whole batch, the ones of the dense head averaged by DDP."""
+    features = features.clone().requires_grad_()
+    centres = centres.clone().requires_grad_()
+    logits = torch.einsum('ncp,pck->nkp', F.normalize(features, dim=1), F.normalize(centres, dim=1)) * scale
+    loss = F.cross_entropy(logits, labels.unsqueeze(1).repeat(1, PARTS), label_smoothing=eps)
+    loss.backward()
+    return loss.detach(), features.grad, centres.grad
+
+
+def run(rank, init_file):
+    torch.distributed.init_process_group('gloo', init_method='file://' + init_file, rank=rank, world_size=WORLD_SIZE)
+    from modeling.losses.partial_fc import PartialFCLoss
+    torch.manual_seed(0)
+    features = torch.randn(BATCH * WORLD_SIZE, CHANNELS, PARTS)
+    labels = torch.randint(0, CLASS_NUM, (BATCH * WORLD_SIZE,))
+    centres = torch.randn(PARTS, CHANNELS, CLASS_NUM)
+    expected_loss, expected_features_grad, expected_centres_grad = dense_grads(features, labels, centres, 16, 0.1)
+
+    loss_func = PartialFCLoss(CLASS_NUM, PARTS, CHANNELS, scale=16, eps=0.1)
+    # sliced into the local shard by the load hook
+    loss_func.load_state_dict({'fc_bin': centres})
+    local = slice(rank * BATCH, (rank + 1) * BATCH)
+    local_features = features[local].clone().requires_grad_()
+    loss, _ = loss_func(local_features, labels[local])
+    loss.backward()
+
+    assert torch.allclose(loss.detach(), expected_loss, atol=1e-5)
+    # DDP averages the gradients of the backbone over the ranks
+    assert torch.allclose(local_features.grad / WORLD_SIZE, expected_features_grad[local], atol=1e-5)
+    classes = slice(loss_func.class_start, loss_func.class_start + loss_func.local_num)
+    assert torch.allclose(loss_func.fc_bin.grad[..., :loss_func.local_num], expected_centres_grad[..., classes], atol=1e-5)
+    # the state dict holds the local centres, the checkpoint all of them
+    assert loss_func.state_dict()['fc_bin'].size(-1) == loss_func.shard_size
+    assert torch.equal(loss_func.gather_state_dict(loss_func.state_dict())['fc_bin'], centres)
+    torch.distributed.destroy_process_group()
+
+
+def test_matches_dense_head(tmp_path):
+    if not torch.distributed.is_available():
+        pytest.skip('torch.distributed is not available')
+    mp.spawn(run, args=(str(tmp_path / 'init'),), nprocs=WORLD_SIZE)
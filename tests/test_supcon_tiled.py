@@ -0,0 +1,40 @@
+"""The tiled `SupConLoss` against the whole similarity matrix: the loss and the gradients of the features."""
+import pytest
+
+torch = pytest.importorskip('torch')
+
+
+def loss_and_grad(features, chunk_size, loss_kwargs, **kwargs):
+    from modeling.losses.supconloss import SupConLoss
+    features = features.clone().requires_grad_()
+    loss = SupConLoss(chunk_size=chunk_size, **loss_kwargs)(features, **kwargs)
+    loss.backward()
+    return loss.detach(), features.grad
+
+
+@pytest.mark.parametrize('loss_kwargs', [
+    {'temperature': 0.5},
+    {'temperature': 0.5, 'contrast_mode': 'one'},
+    {'temperature': 0.5, 'base_temperature': 0.5, 'reduce_zero': True, 'p': 2},
+])
+@pytest.mark.parametrize('chunk_size', [1, 5, 64])
+def test_tiled_matches_dense(loss_kwargs, chunk_size):
+    torch.manual_seed(0)
+    features = torch.randn(12, 2, 16)
+    labels = torch.randint(0, 4, (12,))
+    expected_loss, expected_grad = loss_and_grad(features, 0, loss_kwargs, labels=labels)
+    tiled_loss, tiled_grad = loss_and_grad(features, chunk_size, loss_kwargs, labels=labels)
+    assert torch.allclose(tiled_loss, expected_loss, atol=1e-5)
+    assert torch.allclose(tiled_grad, expected_grad, atol=1e-5)
+
+
+@pytest.mark.parametrize('use_mask', [False, True])
+def test_tiled_matches_dense_without_labels(use_mask):
+    torch.manual_seed(0)
+    features = torch.randn(10, 2, 8)
+    # SimCLR without labels, or an explicit asymmetric mask
+    kwargs = {'mask': (torch.rand(10, 10) > 0.5).float()} if use_mask else {}
+    expected_loss, expected_grad = loss_and_grad(features, 0, {'temperature': 0.5}, **kwargs)
+    tiled_loss, tiled_grad = loss_and_grad(features, 3, {'temperature': 0.5}, **kwargs)
+    assert torch.allclose(tiled_loss, expected_loss, atol=1e-5)
+    assert torch.allclose(tiled_grad, expected_grad, atol=1e-5)
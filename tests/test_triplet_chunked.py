@@ -0,0 +1,81 @@
+"""The chunked and masked triplet paths of `TripletLoss` against the dense ones: the loss, the statistics and the gradients."""
+import pytest
+
+torch = pytest.importorskip('torch')
+
+
+def make_batch(classes=4, per_class=3, channels=8, parts=2):
+    torch.manual_seed(0)
+    embeddings = torch.randn(classes * per_class, channels, parts)
+    labels = torch.arange(classes).repeat_interleave(per_class)
+    return embeddings, labels
+
+
+def run_loss(loss_func, embeddings, labels):
+    """The loss and info of one batch, with the gradients of the embeddings, without the gathering across the ranks."""
+    embeddings = embeddings.clone().requires_grad_()
+    loss, info = type(loss_func).forward.__wrapped__(loss_func, embeddings, labels)
+    loss.sum().backward()
+    return loss.detach(), {k: v.clone() for k, v in info.items()}, embeddings.grad
+
+
+def assert_same(actual, expected):
+    loss, info, grad = actual
+    expected_loss, expected_info, expected_grad = expected
+    assert torch.allclose(loss, expected_loss, atol=1e-6)
+    for k in ['loss', 'hard_loss', 'loss_num', 'mean_dist']:
+        assert torch.allclose(info[k], expected_info[k], atol=1e-6), k
+    assert torch.allclose(grad, expected_grad, atol=1e-6)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 12, 64])
+def test_chunked_batch_all_matches_dense(chunk_size):
+    from modeling.losses.triplet import TripletLoss
+    embeddings, labels = make_batch()
+    expected = run_loss(TripletLoss(margin=0.2), embeddings, labels)
+    actual = run_loss(TripletLoss(margin=0.2, chunk_size=chunk_size), embeddings, labels)
+    assert_same(actual, expected)
+
+
+def test_masked_triplets_match_dense():
+    from modeling.losses.triplet import TripletLoss
+    embeddings, labels = make_batch()
+    loss_func = TripletLoss(margin=0.2)
+    dist = loss_func.ComputeDistance(*[embeddings.permute(2, 0, 1)] * 2)
+    dense = loss_func.AllTriplets(labels, labels, dist, masked=False)
+    masked = loss_func.AllTriplets(labels, labels, dist, masked=True)
+    # the same triplets, the masked ones with zeros for the invalid ones
+    assert torch.allclose(masked.sum(-1), dense.sum(-1), atol=1e-5)
+    assert torch.equal((masked != 0).sum(-1), (dense != 0).sum(-1))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5])
+def test_chunked_masked_with_memory_matches_dense(chunk_size):
+    from modeling.losses.triplet import TripletLoss
+    former, former_labels = make_batch()
+    embeddings, labels = make_batch(classes=4, per_class=2)
+    results = []
+    for size in [chunk_size, 0]:
+        loss_func = TripletLoss(margin=0.2, memory_size=12, chunk_size=chunk_size)
+        run_loss(loss_func, former, former_labels)
+        # all the masked triplets at once for the reference
+        loss_func.chunk_size = size
+        results.append(run_loss(loss_func, embeddings, labels))
+    assert_same(*results)
+
+
+def test_batch_hard_matches_brute_force():
+    from modeling.losses.triplet import TripletLoss
+    embeddings, labels = make_batch()
+    loss, info, _ = run_loss(TripletLoss(margin=0.2, mining='hard'), embeddings, labels)
+    x = embeddings.permute(2, 0, 1)  # [p, n, c]
+    expected = torch.zeros(x.size(0), x.size(1))
+    for p in range(x.size(0)):
+        for i in range(x.size(1)):
+            dist = (x[p] - x[p, i]).norm(dim=-1)
+            positive = labels == labels[i]
+            expected[p, i] = torch.relu(dist[positive].max() - dist[~positive].min() + 0.2)
+    num = (expected != 0).sum(-1).float()
+    expected_loss = (expected.sum(-1) / (num + 1e-9)).masked_fill(num == 0, 0)
+    assert torch.allclose(loss, expected_loss, atol=1e-4)
+    assert torch.equal(info['loss_num'], num)